@@ -0,0 +1,56 @@
+"""Gunicorn settings: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+With preload_app the master imports the app once and forks the workers, so they
+share its code pages copy-on-write and start instantly. Startup schema checks run
+once in the master, before any worker exists, instead of once per worker.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5001')
+# live events only cross workers through the Redis broker (EVENT_BROKER_URL); without
+# it an event reaches only the streams open in the worker that published it, so the
+# default is a single worker and on_starting refuses to start more
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1 if os.getenv('EVENT_BROKER_URL') else 1))
+# threaded workers: each open /api/events stream pins one of these threads for
+# up to EVENT_STREAM_MAX_SECONDS, so streams are capped at half of them per worker
+# and the rest stay free for page and API requests; refused tabs retry later
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+# read by main.py, which preload_app imports after this file
+os.environ.setdefault('EVENT_MAX_STREAMS', str(threads // 2))
+preload_app = True
+timeout = 60
+keepalive = 5
+
+
+def on_starting(server):
+    # the app is already imported here (preload); migrate before the first fork
+    from main import app, db, prepare_database, preload_optional_modules, redis
+    if server.cfg.workers > 1 and not (app.config['EVENT_BROKER_URL'] and redis is not None):
+        server.log.error('%d workers need a shared event broker: set EVENT_BROKER_URL to a redis:// URL '
+                         '(with the redis package installed) or run WEB_CONCURRENCY=1', server.cfg.workers)
+        raise SystemExit(1)
+    preload_optional_modules()
+    with app.app_context():
+        prepare_database()
+        # never hand the master's open SQLite connections to forked workers
+        db.engine.dispose()
+    # exempt everything imported so far from GC passes, which would otherwise
+    # touch (and so copy) every shared page in each worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # threads don't survive fork, so jobs start per worker; the shared-table
+    # maintenance jobs run in whichever worker holds the jobs lock
+    from main import acquire_jobs_lock, start_background_jobs
+    start_background_jobs(maintenance=acquire_jobs_lock())
+
+
+def worker_exit(server, worker):
+    # notifications and views wait a few seconds in memory before they're written;
+    # write them out before a deploy or max-requests recycle ends the worker
+    from main import flush_write_behind_buffers
+    flush_write_behind_buffers()
@@ -1,34 +1,78 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, g, has_request_context, Response, abort, session, send_file
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import UserMixin, login_user, LoginManager, login_required, current_user, logout_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 from markupsafe import Markup
 import os
+import atexit
 import base64
+import json
 import re
 from datetime import datetime, timedelta
-from sqlalchemy import inspect, text
+from sqlalchemy import inspect, text, and_, or_, exists, select, insert, event, func, literal_column, case
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import selectinload, contains_eager, aliased, Session
+from sqlalchemy.orm.attributes import set_committed_value
 import hashlib
+import heapq
+import importlib
+import importlib.util
+import io
+import math
+import queue
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+import click
 from dotenv import load_dotenv
+import functools
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
+# Optional renderers are imported on first use (see markdown_to_html, build_variants);
+# only their presence is checked at startup
+MARKDOWN_AVAILABLE = importlib.util.find_spec('markdown') is not None
+CODEHILITE_AVAILABLE = importlib.util.find_spec('pygments') is not None  # used by markdown codehilite
+PIL_AVAILABLE = importlib.util.find_spec('PIL') is not None  # builds resized image variants
 try:
-    from markdown import markdown as md_to_html
+    import redis  # optional, fans live events out across workers
 except Exception:
-    md_to_html = None
-try:
-    import pygments  # optional, used by markdown codehilite
-    CODEHILITE_AVAILABLE = True
-except Exception:
-    CODEHILITE_AVAILABLE = False
+    redis = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev_secret_key_change_in_production')
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'database.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'database.db'))
+# Trending: engagement inside the window, each event halving in weight every half-life
+app.config['TRENDING_WINDOW_DAYS'] = int(os.getenv('TRENDING_WINDOW_DAYS', 7))
+app.config['TRENDING_HALF_LIFE_HOURS'] = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 24))
+app.config['TRENDING_WEIGHTS'] = {'like': 3.0, 'comment': 5.0, 'view': 1.0}
+app.config['TRENDING_REFRESH_SECONDS'] = int(os.getenv('TRENDING_REFRESH_SECONDS', 300))
+app.config['UNREAD_RECONCILE_SECONDS'] = int(os.getenv('UNREAD_RECONCILE_SECONDS', 900))
+# View counting: 'exact' keeps a PostView row per (post, user); 'hll' keeps fixed-size
+# HyperLogLog sketches per post and per day, and also counts anonymous viewers
+app.config['VIEW_COUNTING'] = os.getenv('VIEW_COUNTING', 'exact')
+app.config['ANALYTICS_ROLLUP_SECONDS'] = int(os.getenv('ANALYTICS_ROLLUP_SECONDS', 600))
+app.config['RECOMMENDATION_REFRESH_SECONDS'] = int(os.getenv('RECOMMENDATION_REFRESH_SECONDS', 600))
+# Live events: unset keeps pub/sub in-process; a redis:// URL shares it between workers
+app.config['EVENT_BROKER_URL'] = os.getenv('EVENT_BROKER_URL')
+app.config['EVENT_KEEPALIVE_SECONDS'] = int(os.getenv('EVENT_KEEPALIVE_SECONDS', 25))
+# Each open stream holds a server thread: streams end after this long (EventSource
+# reconnects on its own), a user gets at most EVENT_STREAMS_PER_USER per process and
+# the process at most EVENT_MAX_STREAMS in all (0 = no limit; gunicorn.conf.py sets
+# it below the worker's thread count so ordinary requests always find a thread)
+app.config['EVENT_STREAM_MAX_SECONDS'] = int(os.getenv('EVENT_STREAM_MAX_SECONDS', 300))
+app.config['EVENT_STREAMS_PER_USER'] = int(os.getenv('EVENT_STREAMS_PER_USER', 3))
+app.config['EVENT_MAX_STREAMS'] = int(os.getenv('EVENT_MAX_STREAMS', 0))
+# Uploads: requests above this are refused with 413 before the body is read
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 10)) * 1024 * 1024
 
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
@@ -37,13 +81,71 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 
+# Per-request SQL statement counter; exposed as X-Query-Count in debug/testing
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+@app.after_request
+def add_query_count_header(response):
+    if app.debug or app.testing:
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+    return response
+
+
+# ===== STARTUP SCHEMA CHECKS =====
+# A database migrated with `flask db upgrade` is recognised by its Alembic revision
+# and skips these checks entirely. Otherwise the ensure_* functions below patch
+# older databases in place, all reading one cached introspection pass.
+MIGRATIONS_DIR = os.path.join(basedir, 'migrations')
+_schema_cache = None  # {table: {column names}}
+
+
+def schema_columns(table):
+    """Column names of ``table`` (None if it doesn't exist) from the cached pass."""
+    global _schema_cache
+    if _schema_cache is None:
+        insp = inspect(db.engine)
+        _schema_cache = {name: {c['name'] for c in cols}
+                         for (_, name), cols in insp.get_multi_columns().items()}
+    return _schema_cache.get(table)
+
+
+def reset_schema_cache():
+    global _schema_cache
+    _schema_cache = None
+
+
+def _migration_scripts():
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    config = Config()
+    config.set_main_option('script_location', MIGRATIONS_DIR)
+    return ScriptDirectory.from_config(config)
+
+
+def schema_at_head():
+    """True when the database is stamped at the newest Alembic revision."""
+    from alembic.migration import MigrationContext
+    with db.engine.connect() as conn:
+        current = set(MigrationContext.configure(conn).get_current_heads())
+    return bool(current) and current == set(_migration_scripts().get_heads())
+
+
+def stamp_schema_head():
+    # a database created from the models already matches the newest revision
+    from alembic.migration import MigrationContext
+    with db.engine.begin() as conn:
+        MigrationContext.configure(conn).stamp(_migration_scripts(), 'head')
+
+
 def ensure_publish_at_column():
     try:
-        insp = inspect(db.engine)
-        tables = insp.get_table_names()
-        if 'post' not in tables:
+        cols = schema_columns('post')
+        if cols is None:
             return False
-        cols = [c['name'] for c in insp.get_columns('post')]
         if 'publish_at' in cols:
             return True
         # add column (SQLite supports ADD COLUMN)
@@ -56,16 +158,16 @@ def ensure_publish_at_column():
 
 def ensure_avatar_column():
     try:
-        insp = inspect(db.engine)
-        tables = insp.get_table_names()
-        if 'user' not in tables:
+        cols = schema_columns('user')
+        if cols is None:
             return False
-        cols = [c['name'] for c in insp.get_columns('user')]
-        if 'avatar_filename' in cols:
-            return True
-        # add column for avatar uploads
+        # add columns for avatar uploads (legacy file name, then blob store reference)
         with db.engine.connect() as conn:
-            conn.execute(text('ALTER TABLE user ADD COLUMN avatar_filename VARCHAR(300)'))
+            if 'avatar_filename' not in cols:
+                conn.execute(text('ALTER TABLE user ADD COLUMN avatar_filename VARCHAR(300)'))
+            if 'avatar_blob' not in cols:
+                conn.execute(text('ALTER TABLE user ADD COLUMN avatar_blob VARCHAR(80)'))
+            conn.commit()
         return True
     except Exception as e:
         app.logger.error('ensure_avatar_column error: %s', e)
@@ -74,11 +176,9 @@ def ensure_avatar_column():
 
 def ensure_bio_column():
     try:
-        insp = inspect(db.engine)
-        tables = insp.get_table_names()
-        if 'user' not in tables:
+        cols = schema_columns('user')
+        if cols is None:
             return False
-        cols = [c['name'] for c in insp.get_columns('user')]
         if 'bio' in cols:
             return True
         # add column for user bio
@@ -92,11 +192,9 @@ def ensure_bio_column():
 
 def ensure_follow_status_column():
     try:
-        insp = inspect(db.engine)
-        tables = insp.get_table_names()
-        if 'follow' not in tables:
+        cols = schema_columns('follow')
+        if cols is None:
             return False
-        cols = [c['name'] for c in insp.get_columns('follow')]
         if 'status' in cols:
             return True
         # add status column to follow table
@@ -108,6 +206,197 @@ def ensure_follow_status_column():
         app.logger.error('ensure_follow_status_column error: %s', e)
         return False
 
+def ensure_post_counter_columns():
+    # denormalized like/comment/view counters; backfilled once when first added
+    try:
+        cols = schema_columns('post')
+        if cols is None:
+            return False
+        missing = [name for name in ('like_count', 'comment_count', 'view_count') if name not in cols]
+        if not missing:
+            return True
+        with db.engine.connect() as conn:
+            for name in missing:
+                conn.execute(text(f'ALTER TABLE post ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0'))
+            conn.commit()
+        reconcile_post_counters()
+        return True
+    except Exception as e:
+        app.logger.error('ensure_post_counter_columns error: %s', e)
+        return False
+
+def ensure_unread_counter_columns():
+    # denormalized unread badge counts; backfilled once when first added
+    try:
+        cols = schema_columns('user')
+        if cols is None:
+            return False
+        missing = [name for name in ('unread_notifications', 'unread_messages') if name not in cols]
+        if not missing:
+            return True
+        with db.engine.connect() as conn:
+            for name in missing:
+                conn.execute(text(f'ALTER TABLE user ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0'))
+            conn.commit()
+        reconcile_unread_counters()
+        return True
+    except Exception as e:
+        app.logger.error('ensure_unread_counter_columns error: %s', e)
+        return False
+
+def ensure_notification_group_columns():
+    # grouped notifications: actor count, named actors and the coalescing lookup index
+    try:
+        cols = schema_columns('notification')
+        if cols is None:
+            return False
+        with db.engine.connect() as conn:
+            if 'actor_count' not in cols:
+                conn.execute(text('ALTER TABLE notification ADD COLUMN actor_count INTEGER NOT NULL DEFAULT 1'))
+            if 'recent_actor_ids' not in cols:
+                conn.execute(text('ALTER TABLE notification ADD COLUMN recent_actor_ids VARCHAR(100)'))
+            if 'started_at' not in cols:
+                conn.execute(text('ALTER TABLE notification ADD COLUMN started_at DATETIME'))
+                conn.execute(text('UPDATE notification SET started_at = created_at'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_notification_group ON notification (user_id, type, post_id, is_read)'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_notification_user_created ON notification (user_id, created_at)'))
+            conn.commit()
+        return True
+    except Exception as e:
+        app.logger.error('ensure_notification_group_columns error: %s', e)
+        return False
+
+def ensure_post_html_columns():
+    # rendered Markdown cache; rows fill in lazily or via `flask render-markdown`
+    try:
+        cols = schema_columns('post')
+        if cols is None:
+            return False
+        with db.engine.connect() as conn:
+            if 'content_html' not in cols:
+                conn.execute(text('ALTER TABLE post ADD COLUMN content_html TEXT'))
+            if 'content_hash' not in cols:
+                conn.execute(text('ALTER TABLE post ADD COLUMN content_hash VARCHAR(64)'))
+            if 'render_version' not in cols:
+                conn.execute(text('ALTER TABLE post ADD COLUMN render_version VARCHAR(50)'))
+            conn.commit()
+        return True
+    except Exception as e:
+        app.logger.error('ensure_post_html_columns error: %s', e)
+        return False
+
+def ensure_post_image_column():
+    # reference into the blob store; legacy image_data is moved by extract_inline_images
+    try:
+        cols = schema_columns('post')
+        if cols is None:
+            return False
+        if 'image_blob' not in cols:
+            with db.engine.connect() as conn:
+                conn.execute(text('ALTER TABLE post ADD COLUMN image_blob VARCHAR(80)'))
+                conn.commit()
+        return True
+    except Exception as e:
+        app.logger.error('ensure_post_image_column error: %s', e)
+        return False
+
+def ensure_image_variant_columns():
+    # resized-variant maps; filled by the image worker pool or `flask build-image-variants`
+    try:
+        post_cols = schema_columns('post')
+        user_cols = schema_columns('user')
+        with db.engine.connect() as conn:
+            if post_cols is not None and 'image_variants' not in post_cols:
+                conn.execute(text('ALTER TABLE post ADD COLUMN image_variants TEXT'))
+            if user_cols is not None and 'avatar_variants' not in user_cols:
+                conn.execute(text('ALTER TABLE user ADD COLUMN avatar_variants TEXT'))
+            conn.commit()
+        return True
+    except Exception as e:
+        app.logger.error('ensure_image_variant_columns error: %s', e)
+        return False
+
+# External-content FTS5 index over post title/content, kept in sync by triggers.
+# The update trigger only fires on title/content so counter bumps don't reindex.
+POST_FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(title, content, content='post', content_rowid='id', tokenize='unicode61')",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_ai AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_ad AFTER DELETE ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_au AFTER UPDATE OF title, content ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+_post_fts_state = {'available': None}
+
+def ensure_post_fts():
+    # search falls back to LIKE when the SQLite build has no FTS5
+    try:
+        if schema_columns('post') is None:
+            return False
+        created = schema_columns('post_fts') is None
+        with db.engine.connect() as conn:
+            for statement in POST_FTS_SCHEMA:
+                conn.execute(text(statement))
+            if created:
+                conn.execute(text("INSERT INTO post_fts(post_fts) VALUES ('rebuild')"))
+            conn.commit()
+        _post_fts_state['available'] = True
+        return True
+    except Exception as e:
+        _post_fts_state['available'] = False
+        app.logger.warning('ensure_post_fts: full-text search unavailable, using LIKE: %s', e)
+        return False
+
+def ensure_tag_count_column():
+    # incrementally maintained tag cloud counts; backfilled once when first added
+    try:
+        cols = schema_columns('tag')
+        if cols is None:
+            return False
+        if 'post_count' in cols:
+            return True
+        with db.engine.connect() as conn:
+            conn.execute(text('ALTER TABLE tag ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_tag_post_count ON tag (post_count)'))
+            conn.commit()
+        reconcile_tag_counts()
+        return True
+    except Exception as e:
+        app.logger.error('ensure_tag_count_column error: %s', e)
+        return False
+
+def ensure_post_feed_index():
+    # keyset pagination on the home feed walks (created_at, id); tables created
+    # before the index was declared on the model don't have it yet
+    try:
+        if schema_columns('post') is None:
+            return False
+        with db.engine.connect() as conn:
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_post_created_at_id ON post (created_at, id)'))
+            conn.commit()
+        return True
+    except Exception as e:
+        app.logger.error('ensure_post_feed_index error: %s', e)
+        return False
+
+def ensure_message_pair_index():
+    # chat history is read per (sender, recipient) direction in created_at order
+    try:
+        if schema_columns('message') is None:
+            return False
+        with db.engine.connect() as conn:
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_message_pair_created ON message (sender_id, recipient_id, created_at)'))
+            conn.commit()
+        return True
+    except Exception as e:
+        app.logger.error('ensure_message_pair_index error: %s', e)
+        return False
+
 # Some Flask installs/environments may not expose `before_first_request` at import time.
 # Run schema fix at startup instead (called below in __main__ before running the app).
 
@@ -126,19 +415,96 @@ def display_name(value):
 
 app.jinja_env.filters['display_name'] = display_name
 
-# Markdown rendering filter
-def render_markdown(text):
+# Markdown rendering. Post bodies are rendered once and cached on the row
+# (content_html), keyed by a hash of the content and MARKDOWN_RENDER_VERSION;
+# bump the version when the extensions or their output change.
+MARKDOWN_EXTENSIONS = ['fenced_code'] + (['codehilite'] if CODEHILITE_AVAILABLE else [])
+MARKDOWN_RENDER_VERSION = '1:' + (','.join(MARKDOWN_EXTENSIONS) if MARKDOWN_AVAILABLE else 'plain')
+
+
+def markdown_to_html(text):
     if not text:
         return ''
-    if md_to_html:
-        exts = ['fenced_code']
-        if CODEHILITE_AVAILABLE:
-            exts.append('codehilite')
-        return Markup(md_to_html(text, extensions=exts))
-    return Markup('<pre>' + Markup.escape(text) + '</pre>')
+    if MARKDOWN_AVAILABLE:
+        from markdown import markdown
+        return markdown(text, extensions=MARKDOWN_EXTENSIONS)
+    return '<pre>' + Markup.escape(text) + '</pre>'
+
+
+def content_hash(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+def refresh_post_html(post):
+    """Render ``post.content`` into the cached HTML columns if they are stale."""
+    digest = content_hash(post.content)
+    if post.content_html is not None and post.content_hash == digest and post.render_version == MARKDOWN_RENDER_VERSION:
+        return False
+    post.content_html = markdown_to_html(post.content)
+    post.content_hash = digest
+    post.render_version = MARKDOWN_RENDER_VERSION
+    return True
+
+
+def cached_post_html(post):
+    """Cached HTML for ``post``, rendering (and queueing a write-back) on a miss."""
+    digest = content_hash(post.content)
+    if post.content_html is not None and post.content_hash == digest and post.render_version == MARKDOWN_RENDER_VERSION:
+        return post.content_html
+    html = markdown_to_html(post.content)
+    # Keep the read-only request's session clean; the row is updated after the response
+    set_committed_value(post, 'content_html', html)
+    set_committed_value(post, 'content_hash', digest)
+    set_committed_value(post, 'render_version', MARKDOWN_RENDER_VERSION)
+    if has_request_context() and post.id is not None:
+        g.setdefault('rendered_posts', {})[post.id] = (post.content, html, digest)
+    return html
+
+
+def render_markdown(value):
+    """``md`` filter: a Post is served from its cached HTML, plain text is rendered directly."""
+    if isinstance(value, Post):
+        return Markup(cached_post_html(value))
+    return Markup(markdown_to_html(value))
 
 app.jinja_env.filters['md'] = render_markdown
 
+
+@app.after_request
+def store_rendered_markdown(response):
+    rendered = g.pop('rendered_posts', None)
+    if rendered:
+        try:
+            table = Post.__table__
+            with db.engine.begin() as conn:
+                for post_id, (content, html, digest) in rendered.items():
+                    # Skip rows whose content changed since they were read
+                    conn.execute(table.update().where(table.c.id == post_id, table.c.content == content).values(
+                        content_html=html, content_hash=digest, render_version=MARKDOWN_RENDER_VERSION
+                    ))
+        except Exception as e:
+            app.logger.error('store_rendered_markdown error: %s', e)
+    return response
+
+@app.cli.command('render-markdown')
+@click.option('--all', 'render_all', is_flag=True, help='Re-render every post, not only stale ones.')
+def render_markdown_command(render_all):
+    """Re-render cached post HTML (run after changing Markdown extensions)."""
+    rendered = 0
+    last_id = 0
+    while True:
+        batch = Post.query.filter(Post.id > last_id).order_by(Post.id).limit(200).all()
+        if not batch:
+            break
+        for post in batch:
+            if render_all:
+                post.content_html = None
+            rendered += refresh_post_html(post)
+        db.session.commit()
+        last_id = batch[-1].id
+    print(f"✓ Rendered {rendered} posts (renderer {MARKDOWN_RENDER_VERSION})")
+
+
 # Uploads
 UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -150,14 +516,285 @@ ALLOWED_EXT = {'png', 'jpg', 'jpeg', 'gif'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXT
 
+
+# ===== BLOB STORE =====
+# Content-addressed image store: files are named by the sha256 of their bytes and
+# sharded two levels deep (blobs/ab/cd/abcd...<ext>), so identical uploads share one
+# file and a name never changes meaning, which lets /blobs/ serve them as immutable.
+BLOB_FOLDER = os.path.join(basedir, 'blobs')
+BLOB_MAX_AGE = 365 * 24 * 3600
+BLOB_NAME_RE = re.compile(r'^[0-9a-f]{64}\.[a-z]{3,4}$')
+BLOB_TYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'gif': 'image/gif',
+              'webp': 'image/webp', 'bmp': 'image/bmp', 'bin': 'application/octet-stream'}
+
+
+def sniff_image_ext(data):
+    # trust the bytes, not the uploaded filename
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    if data.startswith(b'BM'):
+        return 'bmp'
+    return 'bin'
+
+
+def blob_path(name):
+    return os.path.join(BLOB_FOLDER, name[:2], name[2:4], name)
+
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _commit_blob(tmp, name):
+    # rename into place so a concurrent reader never sees a partial file; a blob
+    # that already exists is the same bytes, so the new copy is simply dropped
+    path = blob_path(name)
+    if os.path.exists(path):
+        os.unlink(tmp)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+    return name
+
+
+def _blob_tempfile():
+    tmp_dir = os.path.join(BLOB_FOLDER, 'tmp')  # same filesystem, so the rename is atomic
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tempfile.mkstemp(dir=tmp_dir)
+
+
+def store_blob(data):
+    """Write bytes to the blob store (once per distinct content) and return the blob name."""
+    name = f"{hashlib.sha256(data).hexdigest()}.{sniff_image_ext(data)}"
+    if os.path.exists(blob_path(name)):
+        return name
+    fd, tmp = _blob_tempfile()
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(data)
+    return _commit_blob(tmp, name)
+
+
+def store_upload(file):
+    """Stream an uploaded file into the blob store in chunks, hashing as it goes.
+
+    Returns the blob name, or None for an empty upload. Raises RequestEntityTooLarge
+    past MAX_CONTENT_LENGTH (chunked bodies carry no Content-Length to check up front).
+    """
+    limit = app.config.get('MAX_CONTENT_LENGTH')
+    digest = hashlib.sha256()
+    head = b''
+    size = 0
+    fd, tmp = _blob_tempfile()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if limit and size > limit:
+                    raise RequestEntityTooLarge()
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                out.write(chunk)
+        if not size:
+            os.unlink(tmp)
+            return None
+        return _commit_blob(tmp, f"{digest.hexdigest()}.{sniff_image_ext(head)}")
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    if request.path.startswith('/api/'):
+        return jsonify({'error': f'Upload too large (limit {limit_mb} MB)'}), 413
+    flash(f'That file is too large. Uploads are limited to {limit_mb} MB.', 'error')
+    return redirect(request.referrer or url_for('index'))
+
+
+@app.route('/blobs/<name>')
+def serve_blob(name):
+    if not BLOB_NAME_RE.match(name) or not os.path.exists(blob_path(name)):
+        abort(404)
+    resp = send_file(blob_path(name), mimetype=BLOB_TYPES.get(name.rsplit('.', 1)[1], BLOB_TYPES['bin']),
+                     max_age=BLOB_MAX_AGE, etag=name.split('.', 1)[0])
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    resp.headers['X-Content-Type-Options'] = 'nosniff'
+    return resp
+
+
+def extract_inline_images(batch_size=100):
+    """Move legacy base64 Post.image_data into the blob store, leaving only image_blob."""
+    moved = 0
+    while True:
+        rows = db.session.execute(text(
+            'SELECT id, image_data FROM post WHERE image_data IS NOT NULL LIMIT :n'
+        ), {'n': batch_size}).all()
+        if not rows:
+            break
+        for post_id, data in rows:
+            try:
+                raw = base64.b64decode(data)
+            except (ValueError, TypeError):
+                raw = b''
+            name = store_blob(raw) if raw else None
+            db.session.execute(text(
+                'UPDATE post SET image_blob = :blob, image_data = NULL WHERE id = :id'
+            ), {'blob': name, 'id': post_id})
+            moved += 1
+        db.session.commit()
+    return moved
+
+
+@app.cli.command('extract-images')
+def extract_images_command():
+    """Move inline base64 post images into the content-addressed blob store."""
+    moved = extract_inline_images()
+    print(f"✓ Moved {moved} inline images to {BLOB_FOLDER}")
+
+
+# ===== IMAGE VARIANTS =====
+# Uploads are resized into fixed variants in a small worker pool after the request
+# commits. Re-encoding from pixels drops EXIF/GPS metadata, and every variant lands
+# in the blob store; the row keeps a JSON {variant: blob name} map. Until the map is
+# filled (or without Pillow) templates fall back to the original upload.
+IMAGE_WORKERS = 2
+IMAGE_JPEG_QUALITY = 82
+# name -> (box size in px, square crop?); non-cropped variants are never upscaled
+POST_IMAGE_VARIANTS = {'card': (680, False), 'full': (1600, False)}
+AVATAR_VARIANTS = {'avatar32': (32, True), 'avatar48': (48, True), 'avatar56': (56, True), 'full': (256, True)}
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+
+def image_pool():
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is None:
+            _image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image-variants')
+        return _image_pool
+
+
+def _encode_variant(img, size, crop):
+    from PIL import Image, ImageOps
+    if crop:
+        out = ImageOps.fit(img, (size, size), Image.LANCZOS)
+    else:
+        out = img.copy()
+        out.thumbnail((size, size), Image.LANCZOS)
+    buf = io.BytesIO()
+    if out.mode == 'RGBA':
+        out.save(buf, 'PNG', optimize=True)
+    else:
+        out.save(buf, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def build_variants(path, specs):
+    """Resize the image at `path` into each spec and return {variant: blob name}."""
+    from PIL import Image, ImageOps
+    with Image.open(path) as img:
+        if getattr(img, 'is_animated', False):
+            return {}  # keep animations as uploaded
+        img = ImageOps.exif_transpose(img)  # bake in the orientation before metadata is dropped
+        if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+            img = img.convert('RGBA')
+        else:
+            img = img.convert('RGB')
+        return {name: store_blob(_encode_variant(img, size, crop)) for name, (size, crop) in specs.items()}
+
+
+def _store_variants(model, obj_id, source_field, source, path, specs, target):
+    try:
+        variants = build_variants(path, specs)
+    except Exception as e:
+        # unreadable or non-image upload: record an empty map so the original is served
+        app.logger.error('image variants error for %s %s: %s', model.__tablename__, obj_id, e)
+        variants = {}
+    with app.app_context():
+        # the guard on the source skips rows whose image was replaced meanwhile
+        model.query.filter(model.id == obj_id, getattr(model, source_field) == source).update(
+            {target: json.dumps(variants)}, synchronize_session=False)
+        db.session.commit()
+    if model is User:
+        invalidate_avatar(obj_id)
+
+
+def _submit_variants(*args):
+    if not PIL_AVAILABLE:
+        return None
+    return image_pool().submit(_store_variants, *args)
+
+
+def queue_post_variants(post):
+    """Schedule card/full variants for a post's image; call after commit."""
+    if post.image_filename:
+        return _submit_variants(Post, post.id, 'image_filename', post.image_filename,
+                                os.path.join(UPLOAD_FOLDER, post.image_filename), POST_IMAGE_VARIANTS, 'image_variants')
+    if post.image_blob:
+        return _submit_variants(Post, post.id, 'image_blob', post.image_blob,
+                                blob_path(post.image_blob), POST_IMAGE_VARIANTS, 'image_variants')
+    return None
+
+
+def queue_avatar_variants(user):
+    """Schedule the square avatar variants for a user's upload; call after commit."""
+    if user.avatar_blob:
+        return _submit_variants(User, user.id, 'avatar_blob', user.avatar_blob,
+                                blob_path(user.avatar_blob), AVATAR_VARIANTS, 'avatar_variants')
+    if user.avatar_filename:
+        return _submit_variants(User, user.id, 'avatar_filename', user.avatar_filename,
+                                os.path.join(AVATAR_FOLDER, user.avatar_filename), AVATAR_VARIANTS, 'avatar_variants')
+    return None
+
+
+def pick_variant(variants, specs, size):
+    # smallest generated variant that covers `size`, else the largest one we have
+    sizes = sorted((specs[name][0], blob) for name, blob in variants.items() if name in specs)
+    for box, blob in sizes:
+        if box >= size:
+            return blob
+    return sizes[-1][1] if sizes else None
+
+
+@app.cli.command('build-image-variants')
+def build_image_variants_command():
+    """Generate missing resized variants for post images and avatars."""
+    if not PIL_AVAILABLE:
+        print("Pillow is not installed; originals will be served as uploaded")
+        return
+    jobs = [queue_post_variants(p) for p in Post.query.filter(
+        Post.image_variants.is_(None), or_(Post.image_filename.isnot(None), Post.image_blob.isnot(None)))]
+    jobs += [queue_avatar_variants(u) for u in User.query.filter(
+        User.avatar_variants.is_(None), or_(User.avatar_filename.isnot(None), User.avatar_blob.isnot(None)))]
+    for job in jobs:
+        job.result()
+    print(f"✓ Built variants for {len(jobs)} images")
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(150), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    avatar_filename = db.Column(db.String(300), nullable=True)
+    avatar_filename = db.Column(db.String(300), nullable=True)  # legacy upload under AVATAR_FOLDER
+    avatar_blob = db.Column(db.String(80), nullable=True)  # content-addressed name under BLOB_FOLDER
+    avatar_variants = db.Column(db.Text, nullable=True)  # JSON {variant: blob name}, see queue_avatar_variants
     bio = db.Column(db.String(500), nullable=True)  # User bio/description
     dark_mode = db.Column(db.Boolean, default=False)  # Dark mode preference
+    # Denormalized badge counts, maintained on write (see UNREAD COUNTERS)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    unread_messages = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     posts = db.relationship('Post', backref='author', lazy=True)
     
     # Followers - users who follow this user
@@ -181,6 +818,11 @@ class User(UserMixin, db.Model):
     blocked_by = db.relationship('Block', foreign_keys='Block.blocked_id', backref='user_blocked', lazy=True, cascade='all, delete-orphan')
     blocks = db.relationship('Block', foreign_keys='Block.blocker_id', backref='user_blocking', lazy=True, cascade='all, delete-orphan')
 
+    @property
+    def avatar_urls(self):
+        # memoized {size: url}; see avatar_urls()
+        return avatar_urls(self)
+
 
 class Follow(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -193,20 +835,54 @@ class Follow(db.Model):
     __table_args__ = (db.UniqueConstraint('follower_id', 'following_id', name='unique_follow'),)
 
 
+post_tag = db.Table(
+    'post_tag',
+    db.Column('post_id', db.Integer, db.ForeignKey('post.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Index('ix_post_tag_tag_post', 'tag_id', 'post_id')
+)
+
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)  # Normalized: stripped, lowercase
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Published posts only
+    __table_args__ = (db.Index('ix_tag_post_count', 'post_count'),)
+
+
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    image_data = db.Column(db.Text, nullable=True)
+    image_data = db.deferred(db.Column(db.Text, nullable=True))  # legacy inline base64; see extract_inline_images
     image_filename = db.Column(db.String(300), nullable=True)
+    image_blob = db.Column(db.String(80), nullable=True)  # content-addressed name under BLOB_FOLDER
+    image_variants = db.Column(db.Text, nullable=True)  # JSON {variant: blob name}, see queue_post_variants
     tags = db.Column(db.String(250), nullable=True)
     draft = db.Column(db.Boolean, default=False)
+    # Rendered Markdown cache (see refresh_post_html)
+    content_html = db.Column(db.Text, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    render_version = db.Column(db.String(50), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     published_at = db.Column(db.DateTime, nullable=True)
     publish_at = db.Column(db.DateTime, nullable=True)
+    # Denormalized counters, kept in step by the like/comment/view paths (see bump_post_counter)
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    view_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     likes = db.relationship('Like', backref='post', lazy=True, cascade='all, delete-orphan')
     views = db.relationship('PostView', backref='post', lazy=True, cascade='all, delete-orphan')
+    tag_list = db.relationship('Tag', secondary=post_tag, lazy=True, backref=db.backref('posts', lazy='dynamic'))
+    trending = db.relationship('TrendingScore', uselist=False, lazy=True, cascade='all, delete-orphan')
+    __table_args__ = (db.Index('ix_post_created_at_id', 'created_at', 'id'),)
+
+    @property
+    def preview_comments(self):
+        # filled in bulk by prefetch_post_cards(); falls back to loading every comment
+        cached = self.__dict__.get('_preview_comments')
+        return cached if cached is not None else self.comments[:FEED_COMMENT_PREVIEW]
 
 
 class Comment(db.Model):
@@ -252,8 +928,21 @@ class Notification(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=True)
     comment_id = db.Column(db.Integer, db.ForeignKey('comment.id'), nullable=True)
     is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Latest event folded into this notification
+    started_at = db.Column(db.DateTime, nullable=True)  # First event; the actor recount starts here
+    # Coalescing: repeat events of one type on one target update a single unread row
+    actor_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    recent_actor_ids = db.Column(db.String(100), nullable=True)  # Comma-separated, newest first
     actor = db.relationship('User', foreign_keys=[actor_id])
+    post = db.relationship('Post', foreign_keys=[post_id])
+    __table_args__ = (
+        db.Index('ix_notification_group', 'user_id', 'type', 'post_id', 'is_read'),
+        db.Index('ix_notification_user_created', 'user_id', 'created_at'),
+    )
+
+    @property
+    def recent_actor_list(self):
+        return [int(i) for i in self.recent_actor_ids.split(',')] if self.recent_actor_ids else [self.actor_id]
 
 
 class Message(db.Model):
@@ -265,6 +954,34 @@ class Message(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     sender = db.relationship('User', foreign_keys=[sender_id], overlaps='sent_messages,sent_by')
     recipient = db.relationship('User', foreign_keys=[recipient_id], overlaps='received_messages,received_by')
+    __table_args__ = (
+        db.Index('ix_message_pair_created', 'sender_id', 'recipient_id', 'created_at'),
+    )
+
+
+class Conversation(db.Model):
+    """Inbox summary for a pair of users (user_a_id < user_b_id), maintained on every message write."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_a_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_b_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    unread_a = db.Column(db.Integer, nullable=False, default=0)  # Unread messages addressed to user_a
+    unread_b = db.Column(db.Integer, nullable=False, default=0)  # Unread messages addressed to user_b
+    user_a = db.relationship('User', foreign_keys=[user_a_id])
+    user_b = db.relationship('User', foreign_keys=[user_b_id])
+    last_message = db.relationship('Message', foreign_keys=[last_message_id])
+    __table_args__ = (
+        db.UniqueConstraint('user_a_id', 'user_b_id', name='unique_conversation'),
+        db.Index('ix_conversation_a_last', 'user_a_id', 'last_message_at'),
+        db.Index('ix_conversation_b_last', 'user_b_id', 'last_message_at'),
+    )
+
+    def other_user(self, user_id):
+        return self.user_b if user_id == self.user_a_id else self.user_a
+
+    def unread_for(self, user_id):
+        return self.unread_a if user_id == self.user_a_id else self.unread_b
 
 
 class Block(db.Model):
@@ -295,60 +1012,1351 @@ class CollectionItem(db.Model):
     post = db.relationship('Post')
     __table_args__ = (db.UniqueConstraint('collection_id', 'post_id', name='unique_collection_item'),)
 
+class TrendingScore(db.Model):
+    """Time-decayed engagement score for recently active posts, rebuilt by refresh_trending_scores()."""
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (db.Index('ix_trending_score_score_post', 'score', 'post_id'),)
+
+
+class PostViewSketch(db.Model):
+    """All-time HyperLogLog of a post's distinct viewers (VIEW_COUNTING = 'hll')."""
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed HyperLogLog registers
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class PostViewDaySketch(db.Model):
+    """Distinct viewers of a post on one UTC day; merged across days/posts for analytics."""
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)
+
+
+class PostDailyStats(db.Model):
+    """Per-post, per-day engagement rollup behind the /analytics time ranges."""
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    comments = db.Column(db.Integer, nullable=False, default=0)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (db.Index('ix_post_daily_stats_day', 'day'),)
+
+
+class TimelineEntry(db.Model):
+    """Materialized "following" feed: one row per (follower, post), written when the post goes live."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Timeline owner
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # Copy of post.created_at, the feed sort key
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='unique_timeline_entry'),
+        db.Index('ix_timeline_user_created', 'user_id', 'created_at', 'post_id'),
+        db.Index('ix_timeline_user_author', 'user_id', 'author_id'),
+    )
+
 # attach comments relationship to Post and user relationship for comments
 Post.comments = db.relationship('Comment', backref='post', lazy=True, order_by='Comment.created_at')
 User.comments = db.relationship('Comment', backref='author', lazy=True)
 
 
+# ===== AVATARS =====
+# Comment-heavy pages ask for the same few avatars hundreds of times, so each user's
+# URLs are resolved once per size and kept per process. my_account() and the variant
+# worker drop the entry on change; the TTL bounds staleness in other workers.
+AVATAR_CACHE_TTL = 300
+AVATAR_CACHE_MAX = 50000
+_avatar_cache = {}  # user_id -> (expires, AvatarUrls)
+
+
+@functools.lru_cache(maxsize=AVATAR_CACHE_MAX)
+def gravatar_hash(value):
+    return hashlib.md5(value.strip().lower().encode('utf-8')).hexdigest()
+
+
+class AvatarUrls(dict):
+    """A user's avatar URLs keyed by pixel size, each resolved on first lookup.
+
+    Holds plain copies of the avatar fields rather than the User, so cached entries
+    never touch a detached instance.
+    """
+    __slots__ = ('blob', 'filename', 'variants', 'gravatar')
+
+    def __init__(self, user):
+        super().__init__()
+        self.blob = user.avatar_blob
+        self.filename = user.avatar_filename
+        self.variants = json.loads(user.avatar_variants) if user.avatar_variants else None
+        self.gravatar = gravatar_hash(user.username or '')
+
+    def __missing__(self, size):
+        # prefer uploaded avatar if present, using the smallest resized variant that fits
+        blob = pick_variant(self.variants, AVATAR_VARIANTS, size) if self.variants else None
+        if blob or self.blob:
+            url = url_for('serve_blob', name=blob or self.blob)
+        elif self.filename:
+            url = url_for('static', filename='uploads/avatars/' + self.filename)
+        else:
+            url = f"https://www.gravatar.com/avatar/{self.gravatar}?d=identicon&s={size}"
+        self[size] = url
+        return url
+
+
+def avatar_urls(user):
+    """Return the memoized AvatarUrls for ``user`` (``user.avatar_urls`` in templates)."""
+    now = time.monotonic()
+    entry = _avatar_cache.get(user.id)
+    if entry is not None and now < entry[0]:
+        return entry[1]
+    if len(_avatar_cache) >= AVATAR_CACHE_MAX:
+        _avatar_cache.clear()
+    urls = AvatarUrls(user)
+    if user.id is not None:
+        _avatar_cache[user.id] = (now + AVATAR_CACHE_TTL, urls)
+    return urls
+
+
+def invalidate_avatar(user_id):
+    _avatar_cache.pop(user_id, None)
+
+
+def avatar_url(user, size=48):
+    return avatar_urls(user)[size]
+
+
+@app.cli.command('bench-avatars')
+@click.option('--calls', default=500, show_default=True, help='Avatar lookups per simulated page')
+@click.option('--users', default=25, show_default=True, help='Distinct authors on the page')
+@click.option('--rounds', default=20, show_default=True)
+def bench_avatars_command(calls, users, rounds):
+    """Time avatar resolution for a comment-heavy page, unmemoized vs memoized."""
+    people = User.query.limit(users).all()
+    if not people:
+        people = [User(id=-i, username=f'bench{i}') for i in range(1, users + 1)]
+    sizes = (32, 40, 48)
+    items = [(people[i % len(people)], sizes[i % len(sizes)]) for i in range(calls)]
+    page = app.jinja_env.from_string('{% for u, s in items %}<img src="{{ lookup(u, s) }}">{% endfor %}')
+
+    def unmemoized(user, size):
+        # what every lookup cost before memoization: an md5 and a url_for each time
+        gravatar_hash.cache_clear()
+        return AvatarUrls(user)[size]
+
+    timings = {}
+    with app.test_request_context():
+        for label, lookup in (('unmemoized', unmemoized), ('memoized', lambda u, s: u.avatar_urls[s])):
+            _avatar_cache.clear()
+            page.render(items=items, lookup=lookup)  # warm-up
+            start = time.perf_counter()
+            for _ in range(rounds):
+                page.render(items=items, lookup=lookup)
+            timings[label] = (time.perf_counter() - start) / rounds * 1000
+    print(f"✓ {calls} avatars/page over {len(people)} users: "
+          f"unmemoized {timings['unmemoized']:.2f} ms, memoized {timings['memoized']:.2f} ms per render")
+
+
+def post_image_url(post, variant='card'):
+    # resized variant when ready, otherwise the original upload
+    variants = json.loads(post.image_variants) if post.image_variants else {}
+    if variant in variants:
+        return url_for('serve_blob', name=variants[variant])
+    if post.image_filename:
+        return url_for('static', filename='uploads/' + post.image_filename)
+    if post.image_blob:
+        return url_for('serve_blob', name=post.image_blob)
+    return None
+
+
 @app.context_processor
 def utility_processor():
-    def avatar_url(user, size=48):
-        # prefer uploaded avatar if present
+    return dict(avatar_url=avatar_url, post_image_url=post_image_url, unread_counts=unread_counts)
+
+
+# ===== TAGS =====
+def parse_tags(value):
+    """Split a comma-separated tag string into unique, normalized tag names."""
+    names = []
+    for part in (value or '').split(','):
+        name = part.strip().lower()[:50]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def set_post_tags(post, value):
+    """Point ``post.tag_list`` at Tag rows for the names in ``value``, creating missing ones."""
+    names = parse_tags(value)
+    existing = {t.name: t for t in Tag.query.filter(Tag.name.in_(names)).all()} if names else {}
+    tags = []
+    for name in names:
+        tag = existing.get(name)
+        if tag is None:
+            tag = Tag(name=name)
+            db.session.add(tag)
+        tags.append(tag)
+    post.tag_list = tags
+
+
+def backfill_post_tags():
+    """Populate post_tag from the legacy comma-separated Post.tags strings. Returns posts tagged."""
+    posts = Post.query.filter(Post.tags != None, Post.tags != '').all()
+    for post in posts:
+        set_post_tags(post, post.tags)
+        db.session.flush()
+    db.session.commit()
+    reconcile_tag_counts()
+    return len(posts)
+
+
+TAG_CLOUD_TTL = 60  # Seconds a worker serves /api/tags from memory
+_tag_cloud_cache = {'payload': None, 'etag': None, 'expires': 0.0}
+
+
+def invalidate_tag_cloud():
+    _tag_cloud_cache['expires'] = 0.0
+
+
+def adjust_tag_counts(tags, delta):
+    """Add ``delta`` to the published-post count of each tag in ``tags``."""
+    tag_ids = [tag.id for tag in tags]
+    if not tag_ids:
+        return
+    Tag.query.filter(Tag.id.in_(tag_ids)).update(
+        {Tag.post_count: Tag.post_count + delta}, synchronize_session=False
+    )
+    invalidate_tag_cloud()
+
+
+def reconcile_tag_counts():
+    """Recompute Tag.post_count from published posts. Returns the number of tags repaired."""
+    now = datetime.utcnow()
+    actual = select(func.count(post_tag.c.post_id)).select_from(post_tag).join(
+        Post, Post.id == post_tag.c.post_id
+    ).where(
+        post_tag.c.tag_id == Tag.id,
+        Post.draft == False,
+        (Post.publish_at == None) | (Post.publish_at <= now)
+    ).scalar_subquery()
+    result = db.session.execute(db.update(Tag).where(Tag.post_count != actual).values(post_count=actual))
+    db.session.commit()
+    invalidate_tag_cloud()
+    return result.rowcount
+
+
+def tag_filter(name):
+    """Filter clause for posts carrying the tag ``name`` (an indexed post_tag lookup)."""
+    tag_ids = select(Tag.id).where(Tag.name == name.strip().lower())
+    return Post.id.in_(select(post_tag.c.post_id).where(post_tag.c.tag_id.in_(tag_ids)))
+
+
+@app.cli.command('rebuild-tags')
+def rebuild_tags_command():
+    """Rebuild the normalized tag index from Post.tags."""
+    count = backfill_post_tags()
+    print(f"✓ Indexed tags for {count} posts")
+
+
+# ===== FEED CARD PREFETCH =====
+FEED_COMMENT_PREVIEW = 3  # Comments rendered inline per card; the rest load on demand
+
+
+def prefetch_post_cards(posts, comment_limit=FEED_COMMENT_PREVIEW):
+    """Batch-load everything a post card renders for a page of posts.
+
+    Authors and the first ``comment_limit`` comments (with their authors) are
+    fetched in a constant number of queries, so templates never lazy-load per
+    card. Like/comment/view counts are read from the Post counter columns.
+    """
+    posts = [post for post in posts if post is not None]
+    if not posts:
+        return posts
+    ids = [post.id for post in posts if post.comment_count] if comment_limit else []
+
+    ranked = select(
+        Comment.id.label('id'),
+        func.row_number().over(
+            partition_by=Comment.post_id,
+            order_by=(Comment.created_at, Comment.id)
+        ).label('rn')
+    ).where(Comment.post_id.in_(ids)).subquery()
+    comments = Comment.query.join(ranked, ranked.c.id == Comment.id).filter(
+        ranked.c.rn <= comment_limit
+    ).order_by(Comment.created_at, Comment.id).all() if ids else []
+
+    user_ids = {post.user_id for post in posts} | {c.user_id for c in comments}
+    users = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()}
+
+    comments_by_post = {}
+    for comment in comments:
+        set_committed_value(comment, 'author', users.get(comment.user_id))
+        comments_by_post.setdefault(comment.post_id, []).append(comment)
+
+    for post in posts:
+        set_committed_value(post, 'author', users.get(post.user_id))
+        post._preview_comments = comments_by_post.get(post.id, [])
+    return posts
+
+# ===== POST COUNTERS =====
+def bump_post_counter(post_id, column, delta):
+    """Atomically adjust a denormalized Post counter inside the current transaction."""
+    query = Post.query.filter(Post.id == post_id)
+    if delta < 0:
+        query = query.filter(column >= -delta)
+    query.update({column: column + delta}, synchronize_session=False)
+
+
+def reconcile_post_counters():
+    """Recompute every Post counter from the source tables. Returns the number of rows repaired."""
+    actual = {
+        Post.like_count: select(func.count(Like.id)).where(Like.post_id == Post.id).scalar_subquery(),
+        Post.comment_count: select(func.count(Comment.id)).where(Comment.post_id == Post.id).scalar_subquery(),
+        Post.view_count: select(func.count(PostView.id)).where(PostView.post_id == Post.id).scalar_subquery(),
+    }
+    if app.config['VIEW_COUNTING'] == 'hll':
+        # view_count is the sketch estimate, written by the view flush
+        del actual[Post.view_count]
+    result = db.session.execute(
+        db.update(Post).where(or_(*[column != value for column, value in actual.items()])).values(actual)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Repair drift in the Post like/comment/view counters, Tag post counts and unread badges."""
+    count = reconcile_post_counters()
+    print(f"✓ Reconciled counters on {count} posts")
+    count = reconcile_tag_counts()
+    print(f"✓ Reconciled counts on {count} tags")
+    count = reconcile_unread_counters()
+    print(f"✓ Reconciled unread counters on {count} users")
+
+
+# ===== UNREAD COUNTERS =====
+# Badge counts live in User.unread_* (authoritative, updated in the writing
+# transaction) with a short-lived per-process cache in front for polling.
+UNREAD_CACHE_TTL = 30  # Seconds a cached badge count is served without re-reading the row
+_unread_cache = {}  # user_id -> (expires, notifications, messages)
+
+
+def unread_counts(user_id):
+    """Return ``(notifications, messages)`` unread for ``user_id``."""
+    entry = _unread_cache.get(user_id)
+    if entry is not None and time.monotonic() < entry[0]:
+        return entry[1], entry[2]
+    row = db.session.query(User.unread_notifications, User.unread_messages).filter(User.id == user_id).first()
+    counts = (row[0], row[1]) if row else (0, 0)
+    _unread_cache[user_id] = (time.monotonic() + UNREAD_CACHE_TTL, *counts)
+    return counts
+
+
+def _drop_unread_cache_on_commit(user_id):
+    # dropping it now would let a poll re-cache the old value before the commit lands
+    db.session.info.setdefault('unread_changed', set()).add(user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def drop_changed_unread_counts(session):
+    for user_id in session.info.pop('unread_changed', ()):
+        _unread_cache.pop(user_id, None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_changed_unread_counts(session):
+    session.info.pop('unread_changed', None)
+
+
+def bump_unread_counter(user_id, column, delta):
+    """Atomically adjust a User unread counter (never below zero); the cached copy is dropped on commit."""
+    if not delta:
+        return
+    User.query.filter(User.id == user_id).update(
+        {column: func.max(column + delta, 0)}, synchronize_session=False
+    )
+    _drop_unread_cache_on_commit(user_id)
+
+
+def reset_unread_counter(user_id, column):
+    User.query.filter(User.id == user_id).update({column: 0}, synchronize_session=False)
+    _drop_unread_cache_on_commit(user_id)
+
+
+def add_notification(**fields):
+    """Queue a notification event; it is coalesced and written by the batch flush."""
+    notification_buffer.add(**fields)
+
+
+def retract_notification(**fields):
+    """Queue the undoing of an earlier event (an unlike or unfollow) so its group is recounted."""
+    notification_buffer.add(retract=True, **fields)
+
+
+def reconcile_unread_counters():
+    """Recompute every User unread counter from the source tables. Returns the number of rows repaired."""
+    actual = {
+        User.unread_notifications: select(func.count(Notification.id)).where(
+            Notification.user_id == User.id, Notification.is_read == False
+        ).scalar_subquery(),
+        User.unread_messages: select(func.count(Message.id)).where(
+            Message.recipient_id == User.id, Message.is_read == False
+        ).scalar_subquery(),
+    }
+    result = db.session.execute(
+        db.update(User).where(or_(*[column != value for column, value in actual.items()])).values(actual)
+    )
+    db.session.commit()
+    _unread_cache.clear()
+    return result.rowcount
+
+
+# ===== WRITE-BEHIND BUFFERS =====
+WRITE_BEHIND_ATTEMPTS = 3  # Failed writes of a batch before its events are retried one by one
+_write_behind_buffers = []
+
+
+class WriteBehindBuffer:
+    """Collects events off the request transaction and hands them to ``write`` in batches.
+
+    A daemon thread, started on first use, flushes every ``interval`` seconds or as
+    soon as ``size`` events are pending. A batch that keeps failing is split up so
+    one bad event can't hold back the rest. Events live in memory only: pending ones
+    are flushed at process exit, but anything queued when the process dies is lost.
+    """
+    def __init__(self, name, write, interval, size):
+        self.name = name
+        self.write = write
+        self.interval = interval
+        self.size = size
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one batch at a time
+        self._events = []
+        self._failures = 0  # consecutive failed writes of the batch at the front
+        self._wake = threading.Event()
+        self._thread = None
+        _write_behind_buffers.append(self)
+
+    def add(self, **fields):
+        fields.setdefault('created_at', datetime.utcnow())
+        with self._lock:
+            self._events.append(fields)
+            pending = len(self._events)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        if pending >= self.size:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with app.app_context():
+                try:
+                    self.flush()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error('%s error: %s', self.name, e)
+
+    def flush(self):
+        """Write every pending event now. Returns the number of events written."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+            if not events:
+                return 0
+            try:
+                self.write(events)
+            except Exception:
+                self._failures += 1
+                if self._failures < WRITE_BEHIND_ATTEMPTS:
+                    # Put the batch back in front of anything queued meanwhile and retry next time
+                    with self._lock:
+                        self._events[:0] = events
+                    raise
+                db.session.rollback()
+                self._failures = 0
+                return self._write_each(events)
+            self._failures = 0
+        return len(events)
+
+    def _write_each(self, events):
+        # Last resort for a batch that keeps failing: keep what can be written, drop the rest
+        written = 0
+        for e in events:
+            try:
+                self.write([e])
+                written += 1
+            except Exception as exc:
+                db.session.rollback()
+                app.logger.error('%s dropped event %r: %s', self.name, e, exc)
+        return written
+
+
+@atexit.register
+def flush_write_behind_buffers():
+    """Write out whatever the buffers still hold; runs at exit and from gunicorn's worker_exit."""
+    if not any(buffer._events for buffer in _write_behind_buffers):
+        return
+    with app.app_context():
+        for buffer in _write_behind_buffers:
+            try:
+                buffer.flush()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error('%s lost %d events at exit: %s', buffer.name, len(buffer._events), e)
+
+
+# ===== NOTIFICATION BATCHING =====
+NOTIFICATION_FLUSH_SECONDS = 2  # Longest an event waits in the buffer
+NOTIFICATION_FLUSH_SIZE = 200  # Pending events that trigger an early flush
+NOTIFICATION_RECENT_ACTORS = 2  # Actors named in a grouped notification ("A, B and 40 others")
+# Source rows (a Like, Comment or Follow) are committed just before their event is
+# queued, so a group's recount reaches this far back from its first event
+NOTIFICATION_SOURCE_LAG = timedelta(seconds=30)
+
+
+def notification_actors(user_id, notif_type, post_id):
+    """(actor column, event time column, filters) for the source rows behind a notification group."""
+    if notif_type == 'like':
+        return Like.user_id, Like.created_at, [Like.post_id == post_id]
+    if notif_type == 'comment':
+        return Comment.user_id, Comment.created_at, [Comment.post_id == post_id, Comment.parent_comment_id.is_(None)]
+    if notif_type == 'reply':
+        parent = aliased(Comment)
+        return Comment.user_id, Comment.created_at, [
+            Comment.post_id == post_id,
+            Comment.parent_comment_id.in_(select(parent.id).where(parent.user_id == user_id))
+        ]
+    if notif_type == 'follow':
+        return Follow.follower_id, Follow.created_at, [Follow.following_id == user_id]
+    raise ValueError(f'unknown notification type {notif_type!r}')
+
+
+def write_notification_batch(events):
+    """Fold ``events`` into grouped notifications in one transaction.
+
+    Events for the same recipient, type and post merge into that recipient's
+    latest unread notification of the kind, or start a new one. The actor count
+    and names are recounted from the likes, comments and follows made since the
+    group's first event (and after the last group of the kind the recipient read),
+    so repeat actions count once and retracted ones (``retract=True``, e.g. an
+    unlike) drop out. Recipients are pushed their new unread count once the batch
+    commits.
+    """
+    groups = {}
+    for e in events:
+        groups.setdefault((e['user_id'], e['type'], e.get('post_id')), []).append(e)
+    
+    touched = {}
+    for (user_id, notif_type, post_id), batch in groups.items():
+        notif = Notification.query.filter_by(
+            user_id=user_id, type=notif_type, post_id=post_id, is_read=False
+        ).order_by(Notification.created_at.desc()).first()
+        added = [e for e in batch if not e.get('retract')]
+        if notif is None and not added:
+            continue
+        
+        # The group covers its own events, never anything the recipient already read
+        started_at = notif.started_at if notif is not None and notif.started_at else \
+            min(e['created_at'] for e in added)
+        actor, at, filters = notification_actors(user_id, notif_type, post_id)
+        filters += [actor != user_id, at >= started_at - NOTIFICATION_SOURCE_LAG]
+        last_read = db.session.query(func.max(Notification.created_at)).filter_by(
+            user_id=user_id, type=notif_type, post_id=post_id, is_read=True
+        ).scalar()
+        if last_read is not None:
+            filters.append(at > last_read)
+        actor_count = db.session.query(func.count(actor.distinct())).filter(*filters).scalar()
+        recent = [row[0] for row in db.session.query(actor).filter(*filters).group_by(actor)
+                  .order_by(func.max(at).desc()).limit(NOTIFICATION_RECENT_ACTORS)]
+        
+        if not actor_count:
+            # Everyone behind the group took it back
+            if notif is not None:
+                db.session.delete(notif)
+                bump_unread_counter(user_id, User.unread_notifications, -1)
+                touched.setdefault(user_id, set()).add(notif_type)
+            continue
+        
+        is_new = notif is None
+        if is_new:
+            notif = Notification(user_id=user_id, type=notif_type, post_id=post_id, started_at=started_at)
+        notif.actor_count = actor_count
+        notif.actor_id = recent[0]
+        notif.recent_actor_ids = ','.join(str(i) for i in recent)
+        if added:
+            latest = added[-1]
+            notif.comment_id = latest.get('comment_id')
+            notif.created_at = latest['created_at']
+        if is_new:
+            db.session.add(notif)
+            bump_unread_counter(user_id, User.unread_notifications, 1)
+        touched.setdefault(user_id, set()).add(notif_type)
+    db.session.commit()
+    
+    for user_id, types in touched.items():
+        for notif_type in types:
+            publish_notification(user_id, notif_type)
+
+
+notification_buffer = WriteBehindBuffer(
+    'notification-flush', write_notification_batch, NOTIFICATION_FLUSH_SECONDS, NOTIFICATION_FLUSH_SIZE
+)
+
+
+# ===== VIEW TRACKING =====
+VIEW_FLUSH_SECONDS = 5  # Longest a view waits in the buffer
+VIEW_FLUSH_SIZE = 500  # Pending views that trigger an early flush
+VIEW_COUNT_CACHE_TTL = 30  # Seconds a cached view count is served without re-reading the post
+_view_count_cache = {}  # post_id -> (expires, view_count)
+
+
+def cached_view_count(post_id):
+    """Post.view_count through a short-lived cache; None if the post doesn't exist."""
+    entry = _view_count_cache.get(post_id)
+    if entry is not None and time.monotonic() < entry[0]:
+        return entry[1]
+    count = db.session.query(Post.view_count).filter(Post.id == post_id).scalar()
+    if count is None:
+        _view_count_cache.pop(post_id, None)
+        return None
+    _view_count_cache[post_id] = (time.monotonic() + VIEW_COUNT_CACHE_TTL, count)
+    return count
+
+
+def write_view_batch(events):
+    """Insert buffered views with INSERT OR IGNORE and bump each post's counter by the rows added."""
+    if app.config['VIEW_COUNTING'] == 'hll':
+        return write_view_sketches(events)
+    rows = {}
+    for e in events:
+        rows.setdefault((e['post_id'], e['user_id']), e['created_at'])
+    # Views of posts deleted while queued are dropped
+    live = {pid for (pid,) in db.session.query(Post.id).filter(Post.id.in_({pid for pid, _ in rows}))}
+    by_post = {}
+    for (post_id, user_id), created_at in rows.items():
+        if post_id in live:
+            by_post.setdefault(post_id, []).append({'post_id': post_id, 'user_id': user_id, 'created_at': created_at})
+    
+    stmt = insert(PostView.__table__).prefix_with('OR IGNORE')
+    conn = db.session.connection()
+    added = {}
+    for post_id, batch in by_post.items():
+        inserted = conn.execute(stmt, batch).rowcount
+        if inserted > 0:
+            bump_post_counter(post_id, Post.view_count, inserted)
+            added[post_id] = inserted
+    db.session.commit()
+    
+    for post_id, inserted in added.items():
+        entry = _view_count_cache.get(post_id)
+        if entry is not None:
+            _view_count_cache[post_id] = (entry[0], entry[1] + inserted)
+
+
+view_buffer = WriteBehindBuffer('view-flush', write_view_batch, VIEW_FLUSH_SECONDS, VIEW_FLUSH_SIZE)
+
+
+# ===== HYPERLOGLOG VIEW SKETCHES =====
+HLL_PRECISION = 12  # 4096 registers: ~1.6% standard error, at most 4 KB per sketch before compression
+
+
+class HyperLogLog:
+    """HyperLogLog distinct-count sketch with one byte per register."""
+    def __init__(self, registers=None, p=HLL_PRECISION):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    @classmethod
+    def from_blob(cls, blob):
+        return cls(zlib.decompress(blob)) if blob else cls()
+
+    def to_blob(self):
+        return zlib.compress(bytes(self.registers))
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        bits = 64 - self.p
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = self.m
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+
+def write_view_sketches(events):
+    """Fold buffered views into each post's all-time and per-day sketches and refresh view_count."""
+    by_post = {}
+    for e in events:
+        by_post.setdefault(e['post_id'], []).append(e)
+    sketches = {row.post_id: row for row in PostViewSketch.query.filter(PostViewSketch.post_id.in_(by_post))}
+    live = {pid for (pid,) in db.session.query(Post.id).filter(Post.id.in_(by_post))}
+    
+    counts = {}
+    for post_id, batch in by_post.items():
+        if post_id not in live:
+            continue
+        row = sketches.get(post_id)
+        sketch = HyperLogLog.from_blob(row.registers if row else None)
+        days = {}
+        for e in batch:
+            sketch.add(e['viewer'])
+            days.setdefault(e['created_at'].date(), []).append(e['viewer'])
+        if row is None:
+            db.session.add(PostViewSketch(post_id=post_id, registers=sketch.to_blob()))
+        else:
+            row.registers = sketch.to_blob()
+            row.updated_at = datetime.utcnow()
+        for day, viewers in days.items():
+            day_row = db.session.get(PostViewDaySketch, (post_id, day))
+            day_sketch = HyperLogLog.from_blob(day_row.registers if day_row else None)
+            for viewer in viewers:
+                day_sketch.add(viewer)
+            if day_row is None:
+                db.session.add(PostViewDaySketch(post_id=post_id, day=day, registers=day_sketch.to_blob()))
+            else:
+                day_row.registers = day_sketch.to_blob()
+        counts[post_id] = sketch.count()
+        Post.query.filter(Post.id == post_id).update({Post.view_count: counts[post_id]}, synchronize_session=False)
+    db.session.commit()
+    
+    for post_id, count in counts.items():
+        entry = _view_count_cache.get(post_id)
+        if entry is not None:
+            _view_count_cache[post_id] = (entry[0], count)
+
+
+def daily_unique_viewers(post_ids, start, end):
+    """Distinct viewers per day across ``post_ids`` from ``start`` to ``end`` (dates, inclusive).
+
+    Day sketches of different posts are merged, so a reader of several posts counts once a day.
+    """
+    merged = {}
+    if post_ids:
+        rows = db.session.query(PostViewDaySketch.day, PostViewDaySketch.registers).filter(
+            PostViewDaySketch.post_id.in_(post_ids),
+            PostViewDaySketch.day >= start,
+            PostViewDaySketch.day <= end
+        )
+        for day, blob in rows:
+            sketch = HyperLogLog.from_blob(blob)
+            merged[day] = merged[day].merge(sketch) if day in merged else sketch
+    series = []
+    day = start
+    while day <= end:
+        series.append((day, merged[day].count() if day in merged else 0))
+        day += timedelta(days=1)
+    return series
+
+
+def build_view_sketches():
+    """Seed view sketches from existing PostView rows (when switching to 'hll'). Returns posts sketched."""
+    PostViewSketch.query.delete()
+    PostViewDaySketch.query.delete()
+    db.session.commit()
+    events = [
+        {'post_id': post_id, 'viewer': f'u{user_id}', 'created_at': created_at or datetime.utcnow()}
+        for post_id, user_id, created_at in db.session.query(PostView.post_id, PostView.user_id, PostView.created_at)
+    ]
+    write_view_sketches(events)
+    return PostViewSketch.query.count()
+
+
+@app.cli.command('build-view-sketches')
+def build_view_sketches_command():
+    """Rebuild HyperLogLog view sketches from the PostView table."""
+    count = build_view_sketches()
+    print(f"✓ Built view sketches for {count} posts")
+
+
+# ===== FOLLOWING TIMELINE (fan-out on write) =====
+TIMELINE_BACKFILL_LIMIT = 200  # Most recent posts copied into a timeline when a follow is accepted
+SCHEDULED_PUBLISH_INTERVAL = 60  # Seconds between checks for scheduled posts that are due
+_scheduled_publish_state = {'last_run': 0.0}
+
+
+def _not_blocked(user_col, author_col):
+    return ~exists().where(or_(
+        (Block.blocker_id == user_col) & (Block.blocked_id == author_col),
+        (Block.blocker_id == author_col) & (Block.blocked_id == user_col)
+    ))
+
+
+def fan_out_post(post):
+    """Copy a live post into the timeline of every accepted follower of its author."""
+    rows = select(Follow.follower_id, Post.id, Post.user_id, Post.created_at).where(
+        Post.id == post.id,
+        Follow.following_id == Post.user_id,
+        Follow.status == 'accepted',
+        _not_blocked(Follow.follower_id, Post.user_id)
+    )
+    db.session.execute(
+        insert(TimelineEntry).prefix_with('OR IGNORE').from_select(
+            ['user_id', 'post_id', 'author_id', 'created_at'], rows
+        )
+    )
+
+
+def remove_from_timelines(post_id):
+    TimelineEntry.query.filter_by(post_id=post_id).delete(synchronize_session=False)
+
+
+def backfill_timeline(user_id, author_id, limit=TIMELINE_BACKFILL_LIMIT):
+    """Copy the author's most recent live posts into ``user_id``'s timeline."""
+    now = datetime.utcnow()
+    rows = select(db.literal(user_id), Post.id, Post.user_id, Post.created_at).where(
+        Post.user_id == author_id,
+        Post.draft == False,
+        (Post.publish_at == None) | (Post.publish_at <= now),
+        Post.created_at != None,
+        _not_blocked(db.literal(user_id), Post.user_id)
+    ).order_by(Post.created_at.desc()).limit(limit)
+    db.session.execute(
+        insert(TimelineEntry).prefix_with('OR IGNORE').from_select(
+            ['user_id', 'post_id', 'author_id', 'created_at'], rows
+        )
+    )
+
+
+def prune_timeline(user_id, author_id):
+    TimelineEntry.query.filter_by(user_id=user_id, author_id=author_id).delete(synchronize_session=False)
+
+
+def rebuild_timelines():
+    """Rebuild every timeline from accepted follows. Returns the number of follows replayed."""
+    TimelineEntry.query.delete()
+    follows = Follow.query.filter_by(status='accepted').all()
+    for follow in follows:
+        backfill_timeline(follow.follower_id, follow.following_id)
+    db.session.commit()
+    return len(follows)
+
+
+def publish_scheduled_posts(now=None):
+    """Publish scheduled posts whose publish_at has passed. Returns how many went live."""
+    now = now or datetime.utcnow()
+    due = Post.query.filter(Post.draft == True, Post.publish_at != None, Post.publish_at <= now).all()
+    for post in due:
+        post.draft = False
+        post.published_at = post.publish_at
+        fan_out_post(post)
+        adjust_tag_counts(post.tag_list, 1)
+    if due:
+        db.session.commit()
+    return len(due)
+
+
+@app.before_request
+def publish_due_posts():
+    if request.endpoint == 'static':
+        return
+    current = time.monotonic()
+    if current - _scheduled_publish_state['last_run'] < SCHEDULED_PUBLISH_INTERVAL:
+        return
+    _scheduled_publish_state['last_run'] = current
+    try:
+        publish_scheduled_posts()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error('publish_scheduled_posts error: %s', e)
+
+
+# ===== TRENDING =====
+def _hourly_engagement(model, since):
+    # (post_id, hour bucket, events) for published posts; bucketing keeps the job's
+    # row count bounded by posts x hours rather than by raw events
+    bucket = func.strftime('%Y-%m-%d %H:00:00', model.created_at)
+    return db.session.query(model.post_id, bucket, func.count(model.id)).join(
+        Post, Post.id == model.post_id
+    ).filter(
+        model.created_at >= since, Post.draft == False
+    ).group_by(model.post_id, bucket).all()
+
+
+def refresh_trending_scores(now=None):
+    """Recompute the trending table from engagement inside the window. Returns posts scored."""
+    now = now or datetime.utcnow()
+    since = now - timedelta(days=app.config['TRENDING_WINDOW_DAYS'])
+    half_life = app.config['TRENDING_HALF_LIFE_HOURS']
+    weights = app.config['TRENDING_WEIGHTS']
+
+    scores = {}
+    for kind, model in (('like', Like), ('comment', Comment), ('view', PostView)):
+        weight = weights.get(kind, 0)
+        if not weight:
+            continue
+        for post_id, bucket, count in _hourly_engagement(model, since):
+            age_hours = max((now - datetime.fromisoformat(bucket)).total_seconds() / 3600, 0)
+            scores[post_id] = scores.get(post_id, 0.0) + weight * count * 0.5 ** (age_hours / half_life)
+
+    TrendingScore.query.delete()
+    db.session.bulk_insert_mappings(TrendingScore, [
+        {'post_id': post_id, 'score': score, 'computed_at': now}
+        for post_id, score in scores.items()
+    ])
+    db.session.commit()
+    return len(scores)
+
+
+@app.cli.command('refresh-trending')
+def refresh_trending_command():
+    """Recompute trending scores now."""
+    count = refresh_trending_scores()
+    print(f"✓ Scored {count} trending posts")
+
+
+# ===== ANALYTICS ROLLUPS =====
+ANALYTICS_RANGES = {'7d': 7, '30d': 30, '90d': 90}  # ?range= values served from PostDailyStats; 'all' uses the counters
+
+
+ANALYTICS_ROLLUP_DAYS = max(ANALYTICS_RANGES.values())  # Days recomputed on each run; older rows are never read
+
+
+def rollup_post_stats(full=False):
+    """Bring PostDailyStats up to date. Returns the number of (post, day) rows written.
+
+    Every day the analytics ranges can show is recomputed from the source tables,
+    so unlikes, deleted comments and deleted posts on earlier days drop out too.
+    Rows from before the window are pruned unless ``full`` rebuilds every day.
+    """
+    since = None if full else datetime.utcnow().date() - timedelta(days=ANALYTICS_ROLLUP_DAYS - 1)
+    since_clause = 'WHERE created_at >= :since' if since else ''
+    params = {'since': since.isoformat()} if since else {}
+    
+    # the whole window is rebuilt, so everything from before it goes as well
+    PostDailyStats.query.delete()
+    result = db.session.execute(text(f"""
+        INSERT INTO post_daily_stats (post_id, day, likes, comments, views)
+        SELECT post_id, day, SUM(likes), SUM(comments), SUM(views) FROM (
+            SELECT post_id, date(created_at) AS day, COUNT(*) AS likes, 0 AS comments, 0 AS views
+            FROM "like" {since_clause} GROUP BY post_id, day
+            UNION ALL
+            SELECT post_id, date(created_at) AS day, 0, COUNT(*), 0
+            FROM comment {since_clause} GROUP BY post_id, day
+            UNION ALL
+            SELECT post_id, date(created_at) AS day, 0, 0, COUNT(*)
+            FROM post_view {since_clause} GROUP BY post_id, day
+        )
+        WHERE day IS NOT NULL
+        GROUP BY post_id, day
+    """), params)
+    written = result.rowcount
+    
+    if app.config['VIEW_COUNTING'] == 'hll':
+        # No PostView rows in sketch mode; views come from the day sketches instead
+        sketches = PostViewDaySketch.query
+        if since:
+            sketches = sketches.filter(PostViewDaySketch.day >= since)
+        for sketch in sketches:
+            views = HyperLogLog.from_blob(sketch.registers).count()
+            row = db.session.get(PostDailyStats, (sketch.post_id, sketch.day))
+            if row is None:
+                db.session.add(PostDailyStats(post_id=sketch.post_id, day=sketch.day, likes=0, comments=0, views=views))
+                written += 1
+            else:
+                row.views = views
+    db.session.commit()
+    return written
+
+
+@app.cli.command('rollup-analytics')
+@click.option('--full', is_flag=True, help='Rebuild every day instead of only the analytics window.')
+def rollup_analytics_command(full):
+    """Update the per-post daily analytics rollups."""
+    count = rollup_post_stats(full=full)
+    print(f"✓ Rolled up {count} post-days")
+
+
+# ===== RECOMMENDATIONS =====
+RECOMMENDATION_LIMIT = 20
+RECOMMENDATION_WEIGHTS = {'mutual': 3.0, 'follows_you': 2.0, 'tag': 1.0, 'engagement': 2.0}
+RECOMMENDATION_TAG_FANOUT = 500  # Tags used by more authors than this are too common to score on
+RECOMMENDATION_POPULAR_POOL = 200  # Most-followed users kept ranked as the cold-start fallback
+
+
+class SocialGraph:
+    """In-memory follow/block adjacency plus per-user tag and engagement profiles.
+
+    Follows and blocks are applied incrementally by the routes that change them.
+    ``load()`` rebuilds everything from the database (lazily on first use and on
+    the periodic refresh), which is also when tag and engagement changes land.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._replay = None  # incremental changes made while a load is in flight
+        self.following = {}    # user -> {followed user: accepted?}
+        self.followers = {}    # user -> users following them (any status)
+        self.blocking = {}     # user -> users they blocked
+        self.blocked_by = {}   # user -> users who blocked them
+        self.user_tags = {}    # user -> tag ids on their published posts
+        self.tag_users = {}    # tag id -> users publishing with it
+        self.engaged = {}      # user -> {author: likes + comments on that author's posts}
+        self.popular = []      # most-followed users, descending
+
+    def load(self):
+        with self._lock:
+            self._replay = []
         try:
-            if hasattr(user, 'avatar_filename') and getattr(user, 'avatar_filename'):
-                return url_for('static', filename='uploads/avatars/' + getattr(user, 'avatar_filename'))
+            following, followers, blocking, blocked_by = {}, {}, {}, {}
+            for follower_id, following_id, status in db.session.query(Follow.follower_id, Follow.following_id, Follow.status):
+                following.setdefault(follower_id, {})[following_id] = status == 'accepted'
+                followers.setdefault(following_id, set()).add(follower_id)
+            for blocker_id, blocked_id in db.session.query(Block.blocker_id, Block.blocked_id):
+                blocking.setdefault(blocker_id, set()).add(blocked_id)
+                blocked_by.setdefault(blocked_id, set()).add(blocker_id)
+            
+            user_tags, tag_users = {}, {}
+            for user_id, tag_id in db.session.query(Post.user_id, post_tag.c.tag_id).join(
+                post_tag, post_tag.c.post_id == Post.id
+            ).filter(Post.draft == False).distinct():
+                user_tags.setdefault(user_id, set()).add(tag_id)
+                tag_users.setdefault(tag_id, set()).add(user_id)
+            
+            engaged = {}
+            for model in (Like, Comment):
+                for user_id, author_id, count in db.session.query(model.user_id, Post.user_id, func.count(model.id)).join(
+                    Post, model.post_id == Post.id
+                ).group_by(model.user_id, Post.user_id):
+                    if user_id != author_id:
+                        authors = engaged.setdefault(user_id, {})
+                        authors[author_id] = authors.get(author_id, 0) + count
+            
+            user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+            popular = heapq.nlargest(RECOMMENDATION_POPULAR_POOL, user_ids, key=lambda u: len(followers.get(u, ())))
         except Exception:
-            pass
-        val = ''
-        if hasattr(user, 'email') and getattr(user, 'email'):
-            val = getattr(user, 'email').strip().lower()
-        elif hasattr(user, 'username') and getattr(user, 'username'):
-            val = getattr(user, 'username').strip().lower()
-        h = hashlib.md5(val.encode('utf-8')).hexdigest()
-        return f"https://www.gravatar.com/avatar/{h}?d=identicon&s={size}"
-    return dict(avatar_url=avatar_url)
+            with self._lock:
+                self._replay = None
+            raise
+        
+        with self._lock:
+            self.following, self.followers = following, followers
+            self.blocking, self.blocked_by = blocking, blocked_by
+            self.user_tags, self.tag_users = user_tags, tag_users
+            self.engaged, self.popular = engaged, popular
+            replay, self._replay = self._replay, None
+            self._loaded = True
+            for change, args in replay:
+                change(*args)
+        return len(user_ids)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _record(self, change, args):
+        # Changes that land mid-load are replayed onto the fresh index
+        if self._replay is not None:
+            self._replay.append((change, args))
+        return self._loaded
+
+    def set_follow(self, follower_id, following_id, accepted):
+        with self._lock:
+            if self._record(self.set_follow, (follower_id, following_id, accepted)):
+                self.following.setdefault(follower_id, {})[following_id] = accepted
+                self.followers.setdefault(following_id, set()).add(follower_id)
+
+    def remove_follow(self, follower_id, following_id):
+        with self._lock:
+            if self._record(self.remove_follow, (follower_id, following_id)):
+                self.following.get(follower_id, {}).pop(following_id, None)
+                self.followers.get(following_id, set()).discard(follower_id)
+
+    def add_block(self, blocker_id, blocked_id):
+        with self._lock:
+            if self._record(self.add_block, (blocker_id, blocked_id)):
+                self.blocking.setdefault(blocker_id, set()).add(blocked_id)
+                self.blocked_by.setdefault(blocked_id, set()).add(blocker_id)
+
+    def remove_block(self, blocker_id, blocked_id):
+        with self._lock:
+            if self._record(self.remove_block, (blocker_id, blocked_id)):
+                self.blocking.get(blocker_id, set()).discard(blocked_id)
+                self.blocked_by.get(blocked_id, set()).discard(blocker_id)
+
+    def follower_count(self, user_id):
+        return len(self.followers.get(user_id, ()))
+
+    def recommend(self, user_id, limit=RECOMMENDATION_LIMIT):
+        """Top ``limit`` accounts for ``user_id`` as ``[(user_id, mutual follows)]``, best first."""
+        self._ensure_loaded()
+        weights = RECOMMENDATION_WEIGHTS
+        with self._lock:
+            following = self.following.get(user_id, {})
+            excluded = set(following) | self.blocking.get(user_id, set()) | self.blocked_by.get(user_id, set())
+            excluded.add(user_id)
+            scores, mutuals = {}, {}
+            
+            # Accounts followed by people this user follows
+            for friend, accepted in following.items():
+                if not accepted:
+                    continue
+                for candidate, candidate_accepted in self.following.get(friend, {}).items():
+                    if candidate_accepted and candidate not in excluded:
+                        scores[candidate] = scores.get(candidate, 0.0) + weights['mutual']
+                        mutuals[candidate] = mutuals.get(candidate, 0) + 1
+            # Accounts already following this user
+            for candidate in self.followers.get(user_id, ()):
+                if candidate not in excluded:
+                    scores[candidate] = scores.get(candidate, 0.0) + weights['follows_you']
+            # Authors publishing under the same tags, rarer tags counting for more
+            for tag_id in self.user_tags.get(user_id, ()):
+                authors = self.tag_users.get(tag_id, ())
+                if len(authors) > RECOMMENDATION_TAG_FANOUT:
+                    continue
+                weight = weights['tag'] / math.log(2 + len(authors))
+                for candidate in authors:
+                    if candidate not in excluded:
+                        scores[candidate] = scores.get(candidate, 0.0) + weight
+            # Authors whose posts this user likes and comments on
+            for candidate, count in self.engaged.get(user_id, {}).items():
+                if candidate not in excluded:
+                    scores[candidate] = scores.get(candidate, 0.0) + weights['engagement'] * min(count, 5)
+            
+            ranked = heapq.nlargest(limit, scores, key=lambda c: (scores[c], self.follower_count(c)))
+            if len(ranked) < limit:
+                picked = set(ranked)
+                ranked += [c for c in self.popular if c not in excluded and c not in picked][:limit - len(ranked)]
+            return [(candidate, mutuals.get(candidate, 0)) for candidate in ranked]
+
+
+social_graph = SocialGraph()
+
+
+@app.cli.command('rebuild-recommendations')
+def rebuild_recommendations_command():
+    """Load the recommendation graph and report its size."""
+    count = social_graph.load()
+    print(f"✓ Indexed the follow graph for {count} users")
+
+
+# ===== BACKGROUND JOBS =====
+def run_periodically(interval, job):
+    """Run ``job`` inside an app context every ``interval`` seconds on a daemon thread."""
+    def loop():
+        while True:
+            with app.app_context():
+                try:
+                    job()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error('%s error: %s', job.__name__, e)
+            time.sleep(interval)
+    thread = threading.Thread(target=loop, name=job.__name__, daemon=True)
+    thread.start()
+    return thread
+
+
+def start_background_jobs(maintenance=True):
+    # maintenance jobs write shared tables, so only one process needs them
+    if maintenance:
+        run_periodically(app.config['TRENDING_REFRESH_SECONDS'], refresh_trending_scores)
+        run_periodically(app.config['UNREAD_RECONCILE_SECONDS'], reconcile_unread_counters)
+        run_periodically(app.config['ANALYTICS_ROLLUP_SECONDS'], rollup_post_stats)
+    # the recommendation graph is in-memory, so every serving process loads its own
+    run_periodically(app.config['RECOMMENDATION_REFRESH_SECONDS'], social_graph.load)
+
+
+_jobs_lock_file = None
+
+
+def acquire_jobs_lock():
+    """Return True in the one process that should run the maintenance jobs.
+
+    Takes an exclusive flock on instance/background-jobs.lock for the life of the
+    process; when that worker exits, the replacement gunicorn forks picks it up.
+    """
+    global _jobs_lock_file
+    try:
+        import fcntl
+    except ImportError:  # no flock on this platform: every process runs them
+        return True
+    os.makedirs(app.instance_path, exist_ok=True)
+    fh = open(os.path.join(app.instance_path, 'background-jobs.lock'), 'w')
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return False
+    _jobs_lock_file = fh
+    return True
+
+
+@app.cli.command('rebuild-timelines')
+def rebuild_timelines_command():
+    """Rebuild the materialized following timelines from scratch."""
+    count = rebuild_timelines()
+    print(f"✓ Rebuilt timelines from {count} accepted follows")
+
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+
+# ===== KEYSET (CURSOR) PAGINATION =====
+def encode_cursor(values):
+    """Encode a row's sort key as an opaque, URL-safe cursor token."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """Decode a cursor token back into sort key values, or None if it is invalid."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        decoded = []
+        for col, value in zip(columns, values):
+            if value is not None and col.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            decoded.append(value)
+        return decoded
+    except Exception:
+        return None
+
+
+def _keyset_condition(columns, values, before):
+    # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+    clauses = []
+    for i, col in enumerate(columns):
+        parts = [columns[j] == values[j] for j in range(i)]
+        parts.append(col < values[i] if before else col > values[i])
+        clauses.append(and_(*parts))
+    return or_(*clauses)
+
+
+class KeysetPagination:
+    """Cursor-based page of results.
+
+    Mirrors the attributes templates read from ``paginate()`` results, but never
+    counts the full result set, so ``total`` and ``pages`` are None.
+    """
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.has_next = next_cursor is not None
+        self.has_prev = prev_cursor is not None
+        self.page = None
+        self.pages = None
+        self.total = None
+
+
+def keyset_paginate(query, columns, row_key, per_page, cursor=None, direction='next'):
+    """Page ``query`` in descending order of ``columns`` using a cursor.
+
+    ``row_key`` maps a result row to its values for ``columns``. Each page costs
+    one indexed range read of ``per_page + 1`` rows, regardless of depth.
+    """
+    key = decode_cursor(cursor, columns) if cursor else None
+    backwards = direction == 'prev' and key is not None
+    if backwards:
+        query = query.filter(_keyset_condition(columns, key, before=False)).order_by(*[c.asc() for c in columns])
+    else:
+        if key is not None:
+            query = query.filter(_keyset_condition(columns, key, before=True))
+        query = query.order_by(*[c.desc() for c in columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = encode_cursor(row_key(rows[-1]))
+        if key is not None and (has_more or not backwards):
+            prev_cursor = encode_cursor(row_key(rows[0]))
+    return KeysetPagination(rows, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def feed_query(feed_type):
+    """Unordered home feed query ('for_you' or 'following') and its sort key columns."""
+    if feed_type == 'following':
+        # Posts from followed users are materialized into the timeline table on
+        # publish, so this is a single range read on (user_id, created_at, post_id)
+        query = Post.query.join(TimelineEntry, TimelineEntry.post_id == Post.id).filter(
+            TimelineEntry.user_id == current_user.id
+        )
+        return query, (TimelineEntry.created_at, TimelineEntry.post_id)
+    now = datetime.utcnow()
+    query = Post.query.filter(
+        (Post.draft == False) &
+        ((Post.publish_at == None) | (Post.publish_at <= now))
+    )
+    return query, (Post.created_at, Post.id)
+
+
+def paginate_feed(feed_type, per_page=8):
+    query, columns = feed_query(feed_type)
+    return keyset_paginate(
+        query,
+        columns,
+        lambda post: (post.created_at, post.id),
+        per_page,
+        cursor=request.args.get('cursor'),
+        direction=request.args.get('dir', 'next')
+    )
+
+
 @app.route('/')
 @login_required
 def index():
     feed_type = request.args.get('feed', 'for_you')  # 'for_you' or 'following'
-    page = request.args.get('page', 1, type=int)
-    per_page = 8
-    now = datetime.utcnow()
-    
-    if feed_type == 'following':
-        # Show only posts from users being followed
-        following_user_ids = [user.id for user in current_user.following_users]
-        if not following_user_ids:
-            pagination = db.paginate(db.select(Post).where(False), page=page, per_page=per_page, error_out=False)
-        else:
-            pagination = Post.query.filter(
-                Post.user_id.in_(following_user_ids) &
-                (Post.draft == False) &
-                ((Post.publish_at == None) | (Post.publish_at <= now))
-            ).order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    else:
-        # Show all posts - 'for_you' feed
-        pagination = Post.query.filter(
-            (Post.draft == False) &
-            ((Post.publish_at == None) | (Post.publish_at <= now))
-        ).order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    
-    return render_template('index.html', posts=pagination, pagination_endpoint='index', pagination_args={}, feed_type=feed_type)
+    pagination = paginate_feed(feed_type)
+    prefetch_post_cards(pagination.items)
+    return render_template('index.html', posts=pagination, pagination_endpoint='index', pagination_args={'feed': feed_type}, feed_type=feed_type)
+
+
+@app.route('/api/feed')
+@login_required
+def api_feed():
+    """JSON variant of the home feed for infinite scroll; follow ``next_cursor``."""
+    feed_type = request.args.get('feed', 'for_you')
+    per_page = min(max(request.args.get('per_page', 8, type=int), 1), 50)
+    pagination = paginate_feed(feed_type, per_page=per_page)
+    prefetch_post_cards(pagination.items, comment_limit=0)
+    posts_data = [{
+        'id': post.id,
+        'title': post.title,
+        'content': post.content,
+        'tags': [t.strip() for t in post.tags.split(',') if t.strip()] if post.tags else [],
+        'author': {'id': post.author.id, 'username': display_name(post.author.username)},
+        'image_url': post_image_url(post),
+        'image_full_url': post_image_url(post, 'full'),
+        'created_at': post.created_at.isoformat() if post.created_at else None,
+        'published_at': post.published_at.isoformat() if post.published_at else None,
+        'like_count': post.like_count,
+        'comment_count': post.comment_count,
+        'view_count': post.view_count
+    } for post in pagination.items]
+    return jsonify({
+        'success': True,
+        'posts': posts_data,
+        'next_cursor': pagination.next_cursor,
+        'prev_cursor': pagination.prev_cursor
+    })
 
 @app.route('/my_account', methods=['GET', 'POST'])
 @login_required
@@ -361,13 +2369,12 @@ def my_account():
         if bio:
             current_user.bio = bio
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            # prefix with user id to avoid collisions
-            filename = f"u{current_user.id}_" + filename
-            save_path = os.path.join(UPLOAD_FOLDER, 'avatars', filename)
-            file.save(save_path)
-            current_user.avatar_filename = filename
+        blob = store_upload(file) if file and allowed_file(file.filename) else None
+        if blob:
+            if blob != current_user.avatar_blob:
+                current_user.avatar_blob = blob
+                current_user.avatar_filename = None
+                current_user.avatar_variants = None
             flash('Profile updated.')
         elif bio:
             flash('Bio updated.')
@@ -375,6 +2382,9 @@ def my_account():
             flash('No changes made.')
         
         db.session.commit()
+        invalidate_avatar(current_user.id)
+        if current_user.avatar_blob and current_user.avatar_variants is None:
+            queue_avatar_variants(current_user)
         return redirect(url_for('my_account'))
 
     user_posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).all()
@@ -407,15 +2417,8 @@ def create_post():
             except Exception:
                 publish_at_dt = None
 
-        image_filename = None
-        image_base64 = None
-        if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(save_path)
-            image_filename = filename
-        elif file and file.filename:
-            image_base64 = base64.b64encode(file.read()).decode('utf-8')
+        # streamed to the blob store; identical images share one file
+        image_blob = store_upload(file) if file and file.filename else None
 
         now = datetime.utcnow()
         
@@ -432,8 +2435,7 @@ def create_post():
         new_post = Post(
             title=title, 
             content=content, 
-            image_data=image_base64, 
-            image_filename=image_filename, 
+            image_blob=image_blob, 
             tags=tags, 
             draft=final_draft, 
             user_id=current_user.id, 
@@ -441,8 +2443,15 @@ def create_post():
             published_at=published_at_value,
             publish_at=publish_at_dt
         )
+        set_post_tags(new_post, tags)
+        refresh_post_html(new_post)
         db.session.add(new_post)
+        db.session.flush()
+        if not final_draft:
+            fan_out_post(new_post)
+            adjust_tag_counts(new_post.tag_list, 1)
         db.session.commit()
+        queue_post_variants(new_post)
         
         if final_draft:
             flash('Post scheduled! It will be published at the scheduled time.', 'success')
@@ -467,11 +2476,16 @@ def edit_post(post_id):
         tags = request.form.get('tags', '')
         # Draft option removed - all posts are published by default
         
+        # tags counted in the cloud before this edit (only published posts count)
+        old_tags = set() if post.draft else set(post.tag_list)
+        
         if title:
             post.title = title
         if content:
             post.content = content
+            refresh_post_html(post)
         post.tags = tags
+        set_post_tags(post, tags)
         
         # handle publish_at scheduling
         publish_at_str = request.form.get('publish_at')
@@ -483,13 +2497,11 @@ def edit_post(post_id):
                 publish_at_dt = None
         post.publish_at = publish_at_dt
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(save_path)
-            post.image_filename = filename
-        elif file:
-            post.image_data = base64.b64encode(file.read()).decode('utf-8')
+        image_blob = store_upload(file) if file and file.filename else None
+        if image_blob and image_blob != post.image_blob:
+            post.image_blob = image_blob
+            post.image_filename = None
+            post.image_variants = None
         
         # All posts are published - only scheduled posts are temporarily marked as draft
         now = datetime.utcnow()
@@ -500,7 +2512,17 @@ def edit_post(post_id):
             post.draft = False
             post.published_at = now
         
+        if post.draft:
+            remove_from_timelines(post.id)
+        else:
+            fan_out_post(post)
+        db.session.flush()
+        new_tags = set() if post.draft else set(post.tag_list)
+        adjust_tag_counts(old_tags - new_tags, -1)
+        adjust_tag_counts(new_tags - old_tags, 1)
         db.session.commit()
+        if post.image_variants is None:
+            queue_post_variants(post)
         flash('Post updated successfully.', 'success')
         return redirect(url_for('index'))
 
@@ -518,6 +2540,12 @@ def delete_post(post_id):
     try:
         # Delete all comments associated with this post first
         Comment.query.filter_by(post_id=post_id).delete()
+        PostDailyStats.query.filter_by(post_id=post_id).delete()
+        PostViewSketch.query.filter_by(post_id=post_id).delete()
+        PostViewDaySketch.query.filter_by(post_id=post_id).delete()
+        remove_from_timelines(post_id)
+        if not post.draft:
+            adjust_tag_counts(post.tag_list, -1)
         # Then delete the post
         db.session.delete(post)
         db.session.commit()
@@ -529,6 +2557,38 @@ def delete_post(post_id):
     return redirect(url_for('my_account'))
 
 
+# ===== FULL-TEXT SEARCH =====
+SNIPPET_OPEN, SNIPPET_CLOSE = '\x02', '\x03'  # Placeholders swapped for <mark> after escaping
+
+
+def post_fts_available():
+    if _post_fts_state['available'] is None:
+        try:
+            _post_fts_state['available'] = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_fts'")
+            ).first() is not None
+        except Exception:
+            _post_fts_state['available'] = False
+    return _post_fts_state['available']
+
+
+def fts_match_query(q):
+    """Turn free text into an FTS5 query where every word must match as a prefix."""
+    words = re.findall(r'\w+', q)[:16]
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+def fts_post_ids(match):
+    return select(literal_column('rowid')).select_from(text('post_fts')).where(
+        text('post_fts MATCH :match').bindparams(match=match)
+    )
+
+
+def render_snippet(snippet):
+    escaped = str(Markup.escape(snippet or ''))
+    return Markup(escaped.replace(SNIPPET_OPEN, '<mark>').replace(SNIPPET_CLOSE, '</mark>'))
+
+
 @app.route('/search')
 def search():
     q = request.args.get('q', '')
@@ -537,7 +2597,27 @@ def search():
     page = request.args.get('page', 1, type=int)
     per_page = 8
     now = datetime.utcnow()
-    pagination = Post.query.filter((Post.title.ilike(f"%{q}%")) | (Post.content.ilike(f"%{q}%"))).filter(Post.draft==False).filter((Post.publish_at==None) | (Post.publish_at <= now)).order_by(Post.publish_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    match = fts_match_query(q)
+    if match and post_fts_available():
+        # BM25 ranking (title weighted above body) with highlighted snippets
+        hits = text(
+            "SELECT rowid AS post_id, bm25(post_fts, 5.0, 1.0) AS rank, "
+            "snippet(post_fts, 1, :mark_open, :mark_close, '…', 24) AS snippet "
+            "FROM post_fts WHERE post_fts MATCH :match"
+        ).bindparams(match=match, mark_open=SNIPPET_OPEN, mark_close=SNIPPET_CLOSE).columns(
+            post_id=db.Integer, rank=db.Float, snippet=db.Text
+        ).subquery('hits')
+        pagination = db.session.query(Post, hits.c.snippet).join(hits, hits.c.post_id == Post.id).filter(
+            Post.draft == False
+        ).filter((Post.publish_at == None) | (Post.publish_at <= now)).order_by(
+            hits.c.rank, Post.created_at.desc()
+        ).paginate(page=page, per_page=per_page, error_out=False)
+        for post, snippet in pagination.items:
+            post.search_snippet = render_snippet(snippet)
+        pagination.items = [post for post, _ in pagination.items]
+    else:
+        pagination = Post.query.filter((Post.title.ilike(f"%{q}%")) | (Post.content.ilike(f"%{q}%"))).filter(Post.draft==False).filter((Post.publish_at==None) | (Post.publish_at <= now)).order_by(Post.publish_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    prefetch_post_cards(pagination.items)
     return render_template('index.html', posts=pagination, pagination_endpoint='search', pagination_args={'q': q})
 
 
@@ -546,27 +2626,33 @@ def posts_by_tag(tag):
     page = request.args.get('page', 1, type=int)
     per_page = 8
     now = datetime.utcnow()
-    pagination = Post.query.filter(Post.tags.ilike(f"%{tag}%"), Post.draft==False).filter((Post.publish_at==None) | (Post.publish_at <= now)).order_by(Post.publish_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    pagination = Post.query.filter(tag_filter(tag), Post.draft==False).filter((Post.publish_at==None) | (Post.publish_at <= now)).order_by(Post.publish_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    prefetch_post_cards(pagination.items)
     return render_template('index.html', posts=pagination, pagination_endpoint='posts_by_tag', pagination_args={'tag': tag})
 
 @app.route('/api/tags')
 def api_tags():
     """Return top tags with counts for tag cloud."""
-    try:
-        now = datetime.utcnow()
-        posts = Post.query.filter(Post.draft==False).filter((Post.publish_at==None) | (Post.publish_at <= now)).all()
-        tag_counts = {}
-        for post in posts:
-            if post.tags:
-                for tag in post.tags.split(','):
-                    t = tag.strip()
-                    if t:
-                        tag_counts[t] = tag_counts.get(t, 0) + 1
-        # return top 15 tags sorted by count
-        sorted_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)[:15]
-        return jsonify({'tags': [{'name': t, 'count': c} for t, c in sorted_tags]})
-    except Exception as e:
-        return jsonify({'tags': []})
+    cache = _tag_cloud_cache
+    if cache['payload'] is None or time.monotonic() >= cache['expires']:
+        try:
+            # top 15 tags by their maintained published-post count (index scan, no aggregation)
+            top_tags = Tag.query.filter(Tag.post_count > 0).order_by(
+                Tag.post_count.desc(), Tag.name
+            ).limit(15).all()
+        except Exception as e:
+            return jsonify({'tags': []})
+        payload = json.dumps({'tags': [{'name': t.name, 'count': t.post_count} for t in top_tags]}, separators=(',', ':'))
+        cache.update(
+            payload=payload,
+            etag=hashlib.sha1(payload.encode('utf-8')).hexdigest(),
+            expires=time.monotonic() + TAG_CLOUD_TTL
+        )
+    response = app.response_class(cache['payload'], mimetype='application/json')
+    response.set_etag(cache['etag'])
+    response.cache_control.public = True
+    response.cache_control.max_age = TAG_CLOUD_TTL
+    return response.make_conditional(request)
 
 
 
@@ -580,10 +2666,40 @@ def create_comment(post_id):
         return redirect(url_for('index'))
     comment = Comment(post_id=post.id, user_id=current_user.id, body=body)
     db.session.add(comment)
+    bump_post_counter(post.id, Post.comment_count, 1)
     db.session.commit()
     return redirect(request.referrer or url_for('index'))
 
 
+@app.route('/api/comments/<int:post_id>')
+@login_required
+def api_comments(post_id):
+    """All comments on a post, for expanding a feed card past its inline preview."""
+    # Only posts the viewer could see in a feed: live and not across a block, or their own
+    now = datetime.utcnow()
+    post = Post.query.filter(
+        Post.id == post_id,
+        (Post.user_id == current_user.id) | (
+            (Post.draft == False) &
+            ((Post.publish_at == None) | (Post.publish_at <= now)) &
+            _not_blocked(db.literal(current_user.id), Post.user_id)
+        )
+    ).first_or_404()
+    comments = Comment.query.filter_by(post_id=post_id).options(
+        selectinload(Comment.author)
+    ).order_by(Comment.created_at, Comment.id).all()
+    viewer_id = current_user.id
+    return jsonify({'success': True, 'comments': [{
+        'id': c.id,
+        'body': c.body,
+        'author': display_name(c.author.username),
+        'avatar_url': avatar_url(c.author, 32),
+        'is_op': c.user_id == post.user_id,
+        'created_at': c.created_at.strftime('%b %d, %Y %H:%M') if c.created_at else '',
+        'delete_url': url_for('delete_comment', comment_id=c.id) if viewer_id in (c.user_id, post.user_id) else None
+    } for c in comments]})
+
+
 @app.route('/delete_comment/<int:comment_id>', methods=['POST'])
 @login_required
 def delete_comment(comment_id):
@@ -593,6 +2709,7 @@ def delete_comment(comment_id):
         flash('Not authorized to delete this comment.')
         return redirect(request.referrer or url_for('index'))
     db.session.delete(comment)
+    bump_post_counter(comment.post_id, Post.comment_count, -1)
     db.session.commit()
     flash('Comment deleted.')
     return redirect(request.referrer or url_for('index'))
@@ -725,16 +2842,16 @@ def follow_user(user_id):
     # Create follow request (pending status)
     new_follow = Follow(follower_id=current_user.id, following_id=user_id, status='pending')
     db.session.add(new_follow)
+    db.session.commit()
+    social_graph.set_follow(current_user.id, user_id, accepted=False)
     
-    # Create notification for the user being followed
-    notif = Notification(
+    # Notify the user being followed
+    add_notification(
         user_id=user_id,
         actor_id=current_user.id,
         type='follow'
     )
-    db.session.add(notif)
-    
-    db.session.commit()
+    live_events.publish(user_id, 'follow_request', {'user_id': current_user.id, 'username': current_user.username})
     
     return jsonify({
         'success': True,
@@ -753,7 +2870,10 @@ def unfollow_user(user_id):
     ).first_or_404()
     
     db.session.delete(follow)
+    prune_timeline(current_user.id, user_id)
     db.session.commit()
+    social_graph.remove_follow(current_user.id, user_id)
+    retract_notification(user_id=user_id, actor_id=current_user.id, type='follow')
     
     return jsonify({
         'success': True,
@@ -790,7 +2910,10 @@ def toggle_follow(user_id):
     if existing:
         # Unfollow - delete the follow relationship
         db.session.delete(existing)
+        prune_timeline(current_user.id, user_id)
         db.session.commit()
+        social_graph.remove_follow(current_user.id, user_id)
+        retract_notification(user_id=user_id, actor_id=current_user.id, type='follow')
         return jsonify({
             'success': True,
             'followed': False,
@@ -800,16 +2923,16 @@ def toggle_follow(user_id):
         # Follow - create new follow request (pending status)
         new_follow = Follow(follower_id=current_user.id, following_id=user_id, status='pending')
         db.session.add(new_follow)
+        db.session.commit()
+        social_graph.set_follow(current_user.id, user_id, accepted=False)
         
-        # Create notification for the user being followed
-        notif = Notification(
+        # Notify the user being followed
+        add_notification(
             user_id=user_id,
             actor_id=current_user.id,
             type='follow'
         )
-        db.session.add(notif)
-        
-        db.session.commit()
+        live_events.publish(user_id, 'follow_request', {'user_id': current_user.id, 'username': current_user.username})
         
         return jsonify({
             'success': True,
@@ -860,7 +2983,12 @@ def accept_follow(follow_id):
     else:
         reverse_follow.status = 'accepted'
     
+    # Both directions are now accepted: seed each side's timeline
+    backfill_timeline(follow.follower_id, follow.following_id)
+    backfill_timeline(follow.following_id, follow.follower_id)
     db.session.commit()
+    social_graph.set_follow(follow.follower_id, follow.following_id, accepted=True)
+    social_graph.set_follow(follow.following_id, follow.follower_id, accepted=True)
     
     return jsonify({'success': True})
 
@@ -876,6 +3004,7 @@ def reject_follow(follow_id):
     
     db.session.delete(follow)
     db.session.commit()
+    social_graph.remove_follow(follow.follower_id, follow.following_id)
     
     return jsonify({'success': True})
 
@@ -895,22 +3024,21 @@ def like_post(post_id):
     
     new_like = Like(post_id=post_id, user_id=current_user.id)
     db.session.add(new_like)
+    bump_post_counter(post_id, Post.like_count, 1)
+    db.session.commit()
     
-    # Create notification for post author
+    # Notify the post author
     if post.user_id != current_user.id:
-        notif = Notification(
+        add_notification(
             user_id=post.user_id,
             actor_id=current_user.id,
             type='like',
             post_id=post_id
         )
-        db.session.add(notif)
-    
-    db.session.commit()
     
     return jsonify({
         'success': True,
-        'like_count': len(post.likes)
+        'like_count': post.like_count
     })
 
 
@@ -925,11 +3053,14 @@ def unlike_post(post_id):
     ).first_or_404()
     
     db.session.delete(like)
+    bump_post_counter(post_id, Post.like_count, -1)
     db.session.commit()
+    if post.user_id != current_user.id:
+        retract_notification(user_id=post.user_id, actor_id=current_user.id, type='like', post_id=post_id)
     
     return jsonify({
         'success': True,
-        'like_count': len(post.likes)
+        'like_count': post.like_count
     })
 
 
@@ -945,7 +3076,7 @@ def is_liked(post_id):
     
     return jsonify({
         'liked': liked,
-        'like_count': len(post.likes)
+        'like_count': post.like_count
     })
 
 
@@ -995,21 +3126,53 @@ def is_bookmarked(post_id):
 
 
 @app.route('/api/track_view/<int:post_id>', methods=['POST'])
-@login_required
 def track_view(post_id):
-    post = Post.query.get_or_404(post_id)
+    # Anonymous views only have somewhere to go in sketch mode
+    sketching = app.config['VIEW_COUNTING'] == 'hll'
+    if not current_user.is_authenticated and not sketching:
+        return login_manager.unauthorized()
     
-    existing = PostView.query.filter_by(
-        post_id=post_id,
-        user_id=current_user.id
-    ).first()
+    # Queued and written in bulk by view_buffer; the count may trail by one flush
+    view_count = cached_view_count(post_id)
+    if view_count is None:
+        abort(404)
     
-    if not existing:
-        view = PostView(post_id=post_id, user_id=current_user.id)
-        db.session.add(view)
-        db.session.commit()
+    if current_user.is_authenticated:
+        user_id, viewer = current_user.id, f'u{current_user.id}'
+    else:
+        user_id, viewer = None, 's' + session.setdefault('viewer_id', secrets.token_hex(8))
+    view_buffer.add(post_id=post_id, user_id=user_id, viewer=viewer)
     
-    return jsonify({'view_count': len(post.views)})
+    return jsonify({'view_count': view_count})
+
+
+@app.route('/api/post_state')
+@login_required
+def post_state():
+    """Like/bookmark state and counters for a batch of posts (``?ids=1,2,3``)."""
+    ids = []
+    for part in request.args.get('ids', '').split(','):
+        if part.strip().isdigit():
+            ids.append(int(part))
+    ids = list(dict.fromkeys(ids))[:100]
+    if not ids:
+        return jsonify({'success': True, 'posts': {}})
+
+    liked = {pid for (pid,) in db.session.query(Like.post_id).filter(
+        Like.user_id == current_user.id, Like.post_id.in_(ids)
+    )}
+    bookmarked = {pid for (pid,) in db.session.query(Bookmark.post_id).filter(
+        Bookmark.user_id == current_user.id, Bookmark.post_id.in_(ids)
+    )}
+    rows = db.session.query(Post.id, Post.like_count, Post.comment_count, Post.view_count).filter(Post.id.in_(ids))
+
+    return jsonify({'success': True, 'posts': {str(pid): {
+        'liked': pid in liked,
+        'bookmarked': pid in bookmarked,
+        'like_count': like_count,
+        'comment_count': comment_count,
+        'view_count': view_count
+    } for pid, like_count, comment_count, view_count in rows}})
 
 
 @app.route('/bookmarks')
@@ -1018,11 +3181,13 @@ def bookmarks():
     page = request.args.get('page', 1, type=int)
     per_page = 8
     
-    bookmarks = Bookmark.query.filter_by(user_id=current_user.id).order_by(
+    bookmarks = Bookmark.query.filter_by(user_id=current_user.id).options(
+        selectinload(Bookmark.post)
+    ).order_by(
         Bookmark.created_at.desc()
     ).paginate(page=page, per_page=per_page, error_out=False)
     
-    posts = [b.post for b in bookmarks.items]
+    posts = prefetch_post_cards([b.post for b in bookmarks.items], comment_limit=0)
     
     # Create a mock paginated object
     class PaginatedPosts:
@@ -1054,7 +3219,7 @@ def bookmarks():
 def user_profile(username):
     user = User.query.filter_by(username=username).first_or_404()
     page = request.args.get('page', 1, type=int)
-    tag_filter = request.args.get('tag', '')
+    current_tag = request.args.get('tag', '')
     search_query = request.args.get('search', '')
     per_page = 12
     now = datetime.utcnow()
@@ -1068,28 +3233,30 @@ def user_profile(username):
     )
     
     # Apply tag filter
-    if tag_filter:
-        query = query.filter(Post.tags.ilike(f'%{tag_filter}%'))
+    if current_tag:
+        query = query.filter(tag_filter(current_tag))
     
     # Apply search filter
-    if search_query:
+    search_match = fts_match_query(search_query) if search_query else ''
+    if search_match and post_fts_available():
+        query = query.filter(Post.id.in_(fts_post_ids(search_match)))
+    elif search_query:
         query = query.filter(
             (Post.title.ilike(f'%{search_query}%')) | 
             (Post.content.ilike(f'%{search_query}%'))
         )
     
     posts = query.order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    prefetch_post_cards(posts.items, comment_limit=0)
     
     # Get user's tags
-    all_posts = Post.query.filter_by(user_id=user.id, draft=False).filter(
+    user_tags = [name for (name,) in db.session.query(Tag.name).join(
+        post_tag, post_tag.c.tag_id == Tag.id
+    ).join(Post, Post.id == post_tag.c.post_id).filter(
+        Post.user_id == user.id, Post.draft == False
+    ).filter(
         (Post.publish_at == None) | (Post.publish_at <= now)
-    ).all()
-    tags_set = set()
-    for post in all_posts:
-        if post.tags:
-            for tag in post.tags.split(','):
-                tags_set.add(tag.strip())
-    user_tags = sorted(list(tags_set))
+    ).distinct().order_by(Tag.name).all()]
     
     is_following = False
     follow_status = None
@@ -1103,24 +3270,27 @@ def user_profile(username):
             follow_status = follow.status
     
     return render_template('profile.html', user=user, posts=posts, is_following=is_following, 
-                         follow_status=follow_status, user_tags=user_tags, current_tag=tag_filter,
+                         follow_status=follow_status, user_tags=user_tags, current_tag=current_tag,
                          search_query=search_query, pagination_endpoint='user_profile', 
-                         pagination_args={'username': username, 'tag': tag_filter, 'search': search_query})
+                         pagination_args={'username': username, 'tag': current_tag, 'search': search_query})
 
 
 @app.route('/trending')
 def trending():
-    page = request.args.get('page', 1, type=int)
     per_page = 8
-    now = datetime.utcnow()
     
-    # Get most liked posts from the last 7 days
-    posts = db.session.query(Post).filter(
-        (Post.draft == False) &
-        ((Post.publish_at == None) | (Post.publish_at <= now))
-    ).outerjoin(Like).group_by(Post.id).order_by(
-        db.func.count(Like.id).desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    # Scores are materialized by refresh_trending_scores(); this is a keyset
+    # walk down the (score, post_id) index
+    query = Post.query.join(Post.trending).options(contains_eager(Post.trending)).filter(Post.draft == False)
+    posts = keyset_paginate(
+        query,
+        (TrendingScore.score, TrendingScore.post_id),
+        lambda post: (post.trending.score, post.id),
+        per_page,
+        cursor=request.args.get('cursor'),
+        direction=request.args.get('dir', 'next')
+    )
+    prefetch_post_cards(posts.items, comment_limit=0)
     
     return render_template('trending.html', posts=posts, pagination_endpoint='trending', pagination_args={})
 
@@ -1162,20 +3332,186 @@ def remove_follower(follower_id):
     ).first_or_404()
     
     db.session.delete(follow)
+    prune_timeline(follower_id, current_user.id)
     db.session.commit()
+    social_graph.remove_follow(follower_id, current_user.id)
     
     return jsonify({'success': True})
 
 
+# ===== LIVE EVENTS (SSE) =====
+EVENT_QUEUE_SIZE = 100  # events buffered per open stream before a slow client starts missing them
+
+
+class LocalEventBackend:
+    """Hands published events straight back to this process. Single-worker default and test stand-in."""
+    def start(self, dispatch):
+        self._dispatch = dispatch
+
+    def publish(self, payload):
+        self._dispatch(payload)
+
+
+class RedisEventBackend:
+    """Fans events out to every worker through one Redis pub/sub channel."""
+    channel = 'live-events'
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url)
+
+    def start(self, dispatch):
+        def listen():
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(self.channel)
+            for message in pubsub.listen():
+                try:
+                    dispatch(json.loads(message['data']))
+                except Exception as e:
+                    app.logger.error('live event dispatch error: %s', e)
+
+        threading.Thread(target=listen, name='live-events', daemon=True).start()
+
+    def publish(self, payload):
+        self._client.publish(self.channel, json.dumps(payload))
+
+
+def make_event_backend(url):
+    if url and redis is not None:
+        return RedisEventBackend(url)
+    if url:
+        app.logger.error('EVENT_BROKER_URL is set but redis is not installed; using in-process events')
+    return LocalEventBackend()
+
+
+class EventBroker:
+    """Per-user pub/sub feeding the SSE streams open in this process.
+
+    ``publish`` goes through the backend so that, with a shared backend, every
+    worker delivers the event to whichever of its streams belong to the user.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> set of queues, one per open stream
+        self._open = 0  # streams open in this process, across all users
+        self._backend = None
+
+    @property
+    def backend(self):
+        # Started lazily so the Redis listener thread lives in the serving process
+        with self._lock:
+            if self._backend is None:
+                self._backend = make_event_backend(app.config['EVENT_BROKER_URL'])
+                self._backend.start(self._dispatch)
+            return self._backend
+
+    def set_backend(self, backend):
+        backend.start(self._dispatch)
+        with self._lock:
+            self._backend = backend
+
+    def subscribe(self, user_id, per_user=None, total=None):
+        """Open a stream for ``user_id``, or return None if they already have ``per_user``
+        here or the process already has ``total`` open."""
+        self.backend  # make sure this process is listening before the stream opens
+        stream = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        with self._lock:
+            if total and self._open >= total:
+                return None
+            streams = self._subscribers.setdefault(user_id, set())
+            if per_user is not None and len(streams) >= per_user:
+                return None
+            streams.add(stream)
+            self._open += 1
+        return stream
+
+    def unsubscribe(self, user_id, stream):
+        with self._lock:
+            streams = self._subscribers.get(user_id)
+            if streams is not None and stream in streams:
+                streams.discard(stream)
+                self._open -= 1
+                if not streams:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, event_name, data):
+        try:
+            self.backend.publish({'user_id': user_id, 'event': event_name, 'data': data})
+        except Exception as e:
+            # Live updates are best effort; the write that triggered them already committed
+            app.logger.error('live event publish error: %s', e)
+
+    def _dispatch(self, payload):
+        with self._lock:
+            streams = list(self._subscribers.get(payload['user_id'], ()))
+        for stream in streams:
+            try:
+                stream.put_nowait(payload)
+            except queue.Full:
+                pass
+
+
+live_events = EventBroker()
+
+
+def publish_notification(user_id, notif_type):
+    """Push the recipient's new unread notification count."""
+    count, _ = unread_counts(user_id)
+    live_events.publish(user_id, 'notification', {'type': notif_type, 'unread': count})
+
+
+@app.route('/api/events')
+@login_required
+def event_stream():
+    """Server-Sent Events stream of the current user's messages, notifications and follow requests."""
+    user_id = current_user.id
+    keepalive = app.config['EVENT_KEEPALIVE_SECONDS']
+    stream = live_events.subscribe(user_id, per_user=app.config['EVENT_STREAMS_PER_USER'],
+                                   total=app.config['EVENT_MAX_STREAMS'])
+    if stream is None:
+        # EventSource gives up on any non-200; static/app.js opens a new one after a pause
+        return Response(status=503, headers={'Retry-After': '60'})
+    deadline = time.monotonic() + app.config['EVENT_STREAM_MAX_SECONDS']
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                # end the response at the deadline so the thread is freed; the client reconnects
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    payload = stream.get(timeout=min(keepalive, remaining))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {payload['event']}\ndata: {json.dumps(payload['data'])}\n\n"
+        finally:
+            live_events.unsubscribe(user_id, stream)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 # ===== NOTIFICATIONS =====
 @app.route('/notifications')
 @login_required
 def notifications():
     page = request.args.get('page', 1, type=int)
-    notifs = Notification.query.filter_by(user_id=current_user.id).order_by(
+    notifs = Notification.query.filter_by(user_id=current_user.id).options(
+        selectinload(Notification.actor), selectinload(Notification.post)
+    ).order_by(
         Notification.created_at.desc()
     ).paginate(page=page, per_page=10, error_out=False)
     
+    # Resolve the actors named in grouped notifications with one query
+    actor_ids = {i for notif in notifs.items for i in notif.recent_actor_list}
+    actors = {u.id: u for u in User.query.filter(User.id.in_(actor_ids))} if actor_ids else {}
+    for notif in notifs.items:
+        notif.recent_actors = [actors[i] for i in notif.recent_actor_list if i in actors] or [notif.actor]
+    
     return render_template('notifications.html', notifications=notifs, pagination_endpoint='notifications', pagination_args={})
 
 
@@ -1186,7 +3522,9 @@ def mark_notification_read(notif_id):
     if notif.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    notif.is_read = True
+    if not notif.is_read:
+        notif.is_read = True
+        bump_unread_counter(current_user.id, User.unread_notifications, -1)
     db.session.commit()
     
     return jsonify({'success': True})
@@ -1196,6 +3534,7 @@ def mark_notification_read(notif_id):
 @login_required
 def mark_all_read():
     Notification.query.filter_by(user_id=current_user.id, is_read=False).update({'is_read': True})
+    reset_unread_counter(current_user.id, User.unread_notifications)
     db.session.commit()
     return jsonify({'success': True})
 
@@ -1203,71 +3542,115 @@ def mark_all_read():
 @app.route('/api/unread_count')
 @login_required
 def unread_count():
-    count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-    return jsonify({'count': count})
+    notifications, messages = unread_counts(current_user.id)
+    return jsonify({'count': notifications, 'messages': messages})
 
 
 # ===== DIRECT MESSAGES =====
+def _conversation_pair(user_id, other_id):
+    return (user_id, other_id) if user_id <= other_id else (other_id, user_id)
+
+
+def _conversation_query(user_id, other_id):
+    user_a_id, user_b_id = _conversation_pair(user_id, other_id)
+    return Conversation.query.filter_by(user_a_id=user_a_id, user_b_id=user_b_id)
+
+
+def _unread_column(user_a_id, recipient_id):
+    return Conversation.unread_a if recipient_id == user_a_id else Conversation.unread_b
+
+
+def record_message(msg):
+    """Point the pair's conversation at ``msg`` and count it as unread for the recipient."""
+    user_a_id, user_b_id = _conversation_pair(msg.sender_id, msg.recipient_id)
+    db.session.execute(
+        insert(Conversation).prefix_with('OR IGNORE').values(
+            user_a_id=user_a_id, user_b_id=user_b_id, unread_a=0, unread_b=0
+        )
+    )
+    unread = _unread_column(user_a_id, msg.recipient_id)
+    _conversation_query(msg.sender_id, msg.recipient_id).update({
+        Conversation.last_message_id: msg.id,
+        Conversation.last_message_at: msg.created_at,
+        unread: unread + 1
+    }, synchronize_session=False)
+    bump_unread_counter(msg.recipient_id, User.unread_messages, 1)
+
+
+def forget_message(msg):
+    """Undo ``msg``'s contribution to its conversation after it has been deleted."""
+    if not msg.is_read:
+        bump_unread_counter(msg.recipient_id, User.unread_messages, -1)
+    conv = _conversation_query(msg.sender_id, msg.recipient_id).first()
+    if conv is None:
+        return
+    if not msg.is_read:
+        if msg.recipient_id == conv.user_a_id:
+            conv.unread_a = max(conv.unread_a - 1, 0)
+        else:
+            conv.unread_b = max(conv.unread_b - 1, 0)
+    if conv.last_message_id == msg.id:
+        latest = Message.query.filter(
+            ((Message.sender_id == conv.user_a_id) & (Message.recipient_id == conv.user_b_id)) |
+            ((Message.sender_id == conv.user_b_id) & (Message.recipient_id == conv.user_a_id)),
+            Message.id != msg.id
+        ).order_by(Message.created_at.desc(), Message.id.desc()).first()
+        if latest is None:
+            db.session.delete(conv)
+            return
+        conv.last_message_id = latest.id
+        conv.last_message_at = latest.created_at
+
+
+def mark_conversation_read(user_id, other_id):
+    """Mark everything ``other_id`` sent to ``user_id`` as read."""
+    marked = Message.query.filter_by(sender_id=other_id, recipient_id=user_id, is_read=False).update({'is_read': True})
+    bump_unread_counter(user_id, User.unread_messages, -marked)
+    user_a_id, _ = _conversation_pair(user_id, other_id)
+    _conversation_query(user_id, other_id).update(
+        {_unread_column(user_a_id, user_id): 0}, synchronize_session=False
+    )
+
+
+def rebuild_conversations():
+    """Rebuild every conversation summary from the message table. Returns conversations built."""
+    Conversation.query.delete()
+    db.session.execute(text("""
+        INSERT INTO conversation (user_a_id, user_b_id, last_message_id, last_message_at, unread_a, unread_b)
+        SELECT MIN(sender_id, recipient_id) AS a, MAX(sender_id, recipient_id) AS b,
+               MAX(id), MAX(created_at),
+               SUM(CASE WHEN recipient_id = MIN(sender_id, recipient_id) AND is_read = 0 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN recipient_id = MAX(sender_id, recipient_id) AND sender_id != recipient_id AND is_read = 0 THEN 1 ELSE 0 END)
+        FROM message
+        GROUP BY a, b
+    """))
+    db.session.commit()
+    return Conversation.query.count()
+
+
+@app.cli.command('rebuild-conversations')
+def rebuild_conversations_command():
+    """Rebuild the /messages inbox summaries from the message table."""
+    count = rebuild_conversations()
+    print(f"✓ Rebuilt {count} conversations")
+
+
 @app.route('/messages')
 @login_required
 def messages():
     page = request.args.get('page', 1, type=int)
-    
-    # Get all unique conversation partners
-    # Get all messages where user is sender or recipient
-    sender_partners = db.session.query(
-        Message.recipient_id.label('user_id'),
-        db.func.max(Message.created_at).label('last_msg_time')
-    ).filter(Message.sender_id == current_user.id).group_by(Message.recipient_id).all()
-    
-    recipient_partners = db.session.query(
-        Message.sender_id.label('user_id'),
-        db.func.max(Message.created_at).label('last_msg_time')
-    ).filter(Message.recipient_id == current_user.id).group_by(Message.sender_id).all()
-    
-    # Combine and deduplicate
-    conversations_dict = {}
-    for partner_id, last_time in sender_partners + recipient_partners:
-        if partner_id not in conversations_dict or last_time > conversations_dict[partner_id]:
-            conversations_dict[partner_id] = last_time
-    
-    # Get the latest message for each conversation
-    conversations_with_msgs = []
-    for partner_id, last_time in conversations_dict.items():
-        latest_msg = db.session.query(Message).filter(
-            ((Message.sender_id == current_user.id) & (Message.recipient_id == partner_id)) |
-            ((Message.sender_id == partner_id) & (Message.recipient_id == current_user.id))
-        ).order_by(Message.created_at.desc()).first()
-        
-        if latest_msg:
-            conversations_with_msgs.append(latest_msg)
-    
-    # Sort by creation time
-    conversations_with_msgs.sort(key=lambda x: x.created_at, reverse=True)
-    
-    # Manually paginate
     per_page = 15
-    total = len(conversations_with_msgs)
-    pages = (total + per_page - 1) // per_page
-    
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_conversations = conversations_with_msgs[start:end]
-    
-    # Create a simple pagination object
-    class Pagination:
-        def __init__(self, items, page, per_page, total):
-            self.items = items
-            self.page = page
-            self.per_page = per_page
-            self.total = total
-            self.pages = (total + per_page - 1) // per_page
-            self.has_prev = page > 1
-            self.has_next = page < self.pages
-            self.prev_num = page - 1
-            self.next_num = page + 1
     
-    pagination_obj = Pagination(paginated_conversations, page, per_page, total)
+    # One row per conversation partner, kept current by the message write paths
+    pagination_obj = Conversation.query.filter(
+        (Conversation.user_a_id == current_user.id) | (Conversation.user_b_id == current_user.id)
+    ).options(
+        selectinload(Conversation.user_a),
+        selectinload(Conversation.user_b),
+        selectinload(Conversation.last_message)
+    ).order_by(
+        Conversation.last_message_at.desc(), Conversation.id.desc()
+    ).paginate(page=page, per_page=per_page, error_out=False)
     
     return render_template('messages.html', conversations=pagination_obj, pagination_endpoint='messages', pagination_args={})
 
@@ -1291,7 +3674,7 @@ def chat(user_id):
     ).order_by(Message.created_at.asc()).paginate(page=page, per_page=50, error_out=False)
     
     # Mark as read
-    Message.query.filter_by(sender_id=user_id, recipient_id=current_user.id, is_read=False).update({'is_read': True})
+    mark_conversation_read(current_user.id, user_id)
     db.session.commit()
     
     return render_template('chat.html', other_user=other_user, messages=msgs, is_blocked=False, pagination_endpoint='chat', pagination_args={'user_id': user_id})
@@ -1308,33 +3691,80 @@ def send_message(recipient_id):
     
     msg = Message(sender_id=current_user.id, recipient_id=recipient_id, body=body)
     db.session.add(msg)
+    db.session.flush()
+    record_message(msg)
     db.session.commit()
     
+    live_events.publish(recipient_id, 'message', {
+        'id': msg.id,
+        'sender_id': current_user.id,
+        'sender': current_user.username,
+        'body': msg.body,
+        'at': msg.created_at.isoformat(),
+        'unread': unread_counts(recipient_id)[1]
+    })
+    
     return jsonify({'success': True, 'message_id': msg.id})
 
 
+MESSAGE_PAGE_SIZE = 50
+
+
 @app.route('/api/get_messages/<int:user_id>')
 @login_required
 def get_messages(user_id):
-    """Get all messages with a specific user"""
-    messages = Message.query.filter(
+    """Messages with a specific user, oldest first.
+
+    Without a cursor this is the latest page. ``after_id`` returns only what arrived
+    after that message and ``before_id`` the page of history just before it, so
+    refreshing an open chat costs O(new messages). ``has_more`` says whether another
+    page exists in the requested direction.
+    """
+    after_id = request.args.get('after_id', type=int)
+    before_id = request.args.get('before_id', type=int)
+    limit = max(1, min(request.args.get('limit', MESSAGE_PAGE_SIZE, type=int), MESSAGE_PAGE_SIZE))
+    
+    query = db.session.query(
+        Message.id, Message.sender_id, Message.body, Message.is_read, Message.created_at
+    ).filter(
         ((Message.sender_id == current_user.id) & (Message.recipient_id == user_id)) |
         ((Message.sender_id == user_id) & (Message.recipient_id == current_user.id))
-    ).order_by(Message.created_at.asc()).all()
+    )
     
-    # Mark messages as read
-    Message.query.filter_by(sender_id=user_id, recipient_id=current_user.id, is_read=False).update({'is_read': True})
-    db.session.commit()
+    columns = (Message.created_at, Message.id)
+    cursor_id = after_id if after_id is not None else before_id
+    if cursor_id is not None:
+        anchor = db.session.query(Message.created_at).filter(Message.id == cursor_id).scalar()
+        if anchor is not None:
+            # The plain bound lets each direction's index range start at the anchor
+            bound = Message.created_at >= anchor if after_id is not None else Message.created_at <= anchor
+            query = query.filter(bound, _keyset_condition(columns, (anchor, cursor_id), before=after_id is None))
+        elif after_id is not None:
+            query = query.filter(Message.id > cursor_id)
+        else:
+            query = query.filter(Message.id < cursor_id)
+    
+    newer = after_id is not None
+    order = [c.asc() for c in columns] if newer else [c.desc() for c in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not newer:
+        rows.reverse()
+    
+    # Older history has nothing left to mark read
+    if before_id is None:
+        mark_conversation_read(current_user.id, user_id)
+        db.session.commit()
     
-    msgs_data = [{
-        'id': msg.id,
-        'body': msg.body,
-        'created_at': msg.created_at.isoformat(),
-        'is_sent': msg.sender_id == current_user.id,
-        'is_read': msg.is_read
-    } for msg in messages]
+    msgs_data = []
+    for row in rows:
+        item = {'id': row.id, 'body': row.body, 'at': row.created_at.isoformat(), 'mine': row.sender_id == current_user.id}
+        if item['mine']:
+            item['read'] = bool(row.is_read)
+        msgs_data.append(item)
     
-    return jsonify({'success': True, 'messages': msgs_data})
+    return jsonify({'success': True, 'messages': msgs_data, 'has_more': has_more})
 
 
 @app.route('/api/delete_message/<int:message_id>', methods=['POST'])
@@ -1347,6 +3777,8 @@ def delete_message(message_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     db.session.delete(msg)
+    db.session.flush()
+    forget_message(msg)
     db.session.commit()
     
     return jsonify({'success': True})
@@ -1367,7 +3799,10 @@ def block_user(user_id):
     
     block = Block(blocker_id=current_user.id, blocked_id=user_id)
     db.session.add(block)
+    prune_timeline(current_user.id, user_id)
+    prune_timeline(user_id, current_user.id)
     db.session.commit()
+    social_graph.add_block(current_user.id, user_id)
     
     return jsonify({'success': True})
 
@@ -1378,7 +3813,18 @@ def unblock_user(user_id):
     block = Block.query.filter_by(blocker_id=current_user.id, blocked_id=user_id).first_or_404()
     
     db.session.delete(block)
+    db.session.flush()
+    # Restore timelines for any follows that survived the block
+    for follow in Follow.query.filter(
+        or_(
+            (Follow.follower_id == current_user.id) & (Follow.following_id == user_id),
+            (Follow.follower_id == user_id) & (Follow.following_id == current_user.id)
+        ),
+        Follow.status == 'accepted'
+    ).all():
+        backfill_timeline(follow.follower_id, follow.following_id)
     db.session.commit()
+    social_graph.remove_block(current_user.id, user_id)
     
     return jsonify({'success': True})
 
@@ -1466,26 +3912,25 @@ def reply_comment(comment_id):
         return jsonify({'error': 'Reply cannot be empty'}), 400
     
     reply = Comment(
-        author_id=current_user.id,
+        user_id=current_user.id,
         post_id=parent_comment.post_id,
         body=body,
         parent_comment_id=comment_id
     )
     
     db.session.add(reply)
+    bump_post_counter(parent_comment.post_id, Post.comment_count, 1)
     db.session.commit()
     
     # Create notification
-    if parent_comment.author_id != current_user.id:
-        notif = Notification(
-            user_id=parent_comment.author_id,
+    if parent_comment.user_id != current_user.id:
+        add_notification(
+            user_id=parent_comment.user_id,
             actor_id=current_user.id,
             type='reply',
             comment_id=reply.id,
             post_id=parent_comment.post_id
         )
-        db.session.add(notif)
-        db.session.commit()
     
     return jsonify({'success': True, 'reply_id': reply.id})
 
@@ -1494,18 +3939,29 @@ def reply_comment(comment_id):
 @app.route('/recommendations')
 @login_required
 def recommendations():
-    # Get users the current user doesn't follow
-    following_ids = db.session.query(Follow.following_id).filter_by(follower_id=current_user.id).all()
-    following_ids = [f[0] for f in following_ids] + [current_user.id]
-    
-    # Get recommendations: users with most followers, excluding following
-    # Simple approach: get all users not followed and sort in Python by follower count
-    recommended_users = User.query.filter(
-        User.id.notin_(following_ids)
-    ).all()
-    
-    # Sort by follower count in descending order
-    recommended_users = sorted(recommended_users, key=lambda x: x.followers.count(), reverse=True)[:20]
+    # Scored from the in-memory graph; the database is only asked for the picked users
+    picks = social_graph.recommend(current_user.id)
+    ids = [user_id for user_id, _ in picks]
+    # This worker's graph can lag a block or follow made through another one, so the
+    # picks are re-checked against the database in the same lookup
+    users = {user.id: user for user in User.query.filter(
+        User.id.in_(ids),
+        _not_blocked(db.literal(current_user.id), User.id),
+        ~exists().where(Follow.follower_id == current_user.id, Follow.following_id == User.id)
+    )} if ids else {}
+    post_counts = dict(db.session.query(Post.user_id, func.count(Post.id)).filter(
+        Post.user_id.in_(ids)
+    ).group_by(Post.user_id)) if ids else {}
+    
+    recommended_users = []
+    for user_id, mutual_count in picks:
+        user = users.get(user_id)
+        if user is None:
+            continue
+        user.follower_total = social_graph.follower_count(user_id)
+        user.post_total = post_counts.get(user_id, 0)
+        user.mutual_count = mutual_count
+        recommended_users.append(user)
     
     return render_template('recommendations.html', recommended_users=recommended_users)
 
@@ -1528,7 +3984,10 @@ def api_toggle_follow(user_id):
     if existing_follow:
         # Unfollow
         db.session.delete(existing_follow)
+        prune_timeline(current_user.id, user_to_follow.id)
         db.session.commit()
+        social_graph.remove_follow(current_user.id, user_to_follow.id)
+        retract_notification(user_id=user_to_follow.id, actor_id=current_user.id, type='follow')
         return jsonify({'success': True, 'followed': False})
     else:
         # Follow
@@ -1538,15 +3997,16 @@ def api_toggle_follow(user_id):
             status='accepted'  # Auto-accept for now
         )
         db.session.add(new_follow)
+        backfill_timeline(current_user.id, user_to_follow.id)
+        db.session.commit()
+        social_graph.set_follow(current_user.id, user_to_follow.id, accepted=True)
         
         # Create notification
-        notif = Notification(
+        add_notification(
             user_id=user_to_follow.id,
             actor_id=current_user.id,
             type='follow'
         )
-        db.session.add(notif)
-        db.session.commit()
         return jsonify({'success': True, 'followed': True})
 
 
@@ -1554,37 +4014,63 @@ def api_toggle_follow(user_id):
 @app.route('/analytics')
 @login_required
 def analytics():
-    # Get current user's posts with stats
-    posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).all()
-    
-    analytics_data = []
-    for post in posts:
-        likes_count = len(post.likes)
-        comments_count = len(post.comments)
-        views_count = len(post.views)
-        engagement_rate = (likes_count + comments_count) / max(views_count, 1) * 100 if views_count > 0 else 0
-        
-        analytics_data.append({
-            'post': post,
-            'likes': likes_count,
-            'comments': comments_count,
-            'views': views_count,
-            'engagement_rate': engagement_rate
-        })
+    range_key = request.args.get('range', 'all')
+    if range_key not in ANALYTICS_RANGES:
+        range_key = 'all'
     
-    # Sort by engagement
-    analytics_data.sort(key=lambda x: x['engagement_rate'], reverse=True)
+    if range_key == 'all':
+        likes, comments, views = Post.like_count, Post.comment_count, Post.view_count
+        query = db.session.query(Post.id)
+    else:
+        # Sum the daily rollups inside the range, joined back to the posts in the same statement
+        start = datetime.utcnow().date() - timedelta(days=ANALYTICS_RANGES[range_key] - 1)
+        stats = db.session.query(
+            PostDailyStats.post_id,
+            func.sum(PostDailyStats.likes).label('likes'),
+            func.sum(PostDailyStats.comments).label('comments'),
+            func.sum(PostDailyStats.views).label('views')
+        ).filter(PostDailyStats.day >= start).group_by(PostDailyStats.post_id).subquery()
+        likes, comments, views = (func.coalesce(stats.c.likes, 0), func.coalesce(stats.c.comments, 0),
+                                  func.coalesce(stats.c.views, 0))
+        query = db.session.query(Post.id).outerjoin(stats, stats.c.post_id == Post.id)
+    
+    engagement = case((views > 0, (likes + comments) * 100.0 / views), else_=0.0)
+    rows = query.add_columns(
+        func.substr(Post.content, 1, 50).label('content'),
+        Post.created_at,
+        likes.label('likes'),
+        comments.label('comments'),
+        views.label('views'),
+        engagement.label('engagement_rate')
+    ).filter(Post.user_id == current_user.id).order_by(engagement.desc(), Post.created_at.desc()).all()
+    
+    analytics_data = [{
+        'post': row,
+        'likes': row.likes,
+        'comments': row.comments,
+        'views': row.views,
+        'engagement_rate': row.engagement_rate
+    } for row in rows]
     
     total_likes = sum(a['likes'] for a in analytics_data)
     total_views = sum(a['views'] for a in analytics_data)
     total_comments = sum(a['comments'] for a in analytics_data)
     
+    daily_viewers = None
+    if app.config['VIEW_COUNTING'] == 'hll':
+        today = datetime.utcnow().date()
+        days = ANALYTICS_RANGES.get(range_key, 14)
+        daily_viewers = daily_unique_viewers([row.id for row in rows], today - timedelta(days=days - 1), today)
+    
     return render_template('analytics.html', 
         analytics=analytics_data,
         total_likes=total_likes,
         total_views=total_views,
         total_comments=total_comments,
-        avg_engagement=sum(a['engagement_rate'] for a in analytics_data) / max(len(analytics_data), 1)
+        avg_engagement=sum(a['engagement_rate'] for a in analytics_data) / max(len(analytics_data), 1),
+        daily_viewers=daily_viewers,
+        range_key=range_key,
+        ranges=ANALYTICS_RANGES
     )
 
 
@@ -1649,28 +4135,122 @@ def debug_posts():
     
     return output
 
+# ===== STARTUP =====
+def ensure_schema():
+    """Patch a database that isn't at the Alembic head up to the current models.
+
+    Once every patch and data fix has applied, the database is stamped at the head
+    so later starts take the fast path in prepare_database().
+    """
+    fresh = not schema_columns('post')
+    db.create_all()
+    reset_schema_cache()
+    # Ensure missing columns exist to avoid runtime query errors
+    patched = all([
+        ensure_publish_at_column(),
+        ensure_avatar_column(),
+        ensure_bio_column(),
+        ensure_follow_status_column(),
+        ensure_post_counter_columns(),
+        ensure_unread_counter_columns(),
+        ensure_notification_group_columns(),
+        ensure_post_html_columns(),
+        ensure_post_image_column(),
+        ensure_image_variant_columns(),
+        ensure_post_feed_index(),
+        ensure_message_pair_index(),
+        ensure_tag_count_column(),
+    ])
+    ensure_post_fts()  # optional: search falls back to LIKE without FTS5
+    reset_schema_cache()
+    if not fresh:
+        # data fixes that Alembic installs get from their migrations
+        if db.session.query(Post.id).filter(Post.image_data.isnot(None)).first():
+            extract_inline_images()
+        # Fix existing posts with NULL published_at and draft=False
+        # These should have been published (migration 5d8c2f61b4a9)
+        db.session.execute(text("""
+            UPDATE post 
+            SET published_at = created_at 
+            WHERE published_at IS NULL AND draft = 0 AND created_at IS NOT NULL
+        """))
+        db.session.commit()
+    if patched:
+        stamp_schema_head()
+    else:
+        app.logger.warning('ensure_schema: some patches failed; the checks will run again next start')
+
+
+def prepare_database():
+    """Bring the schema up to date and run one-off backfills.
+
+    Runs once per deploy: in the gunicorn master before workers fork (see
+    gunicorn.conf.py), or before the dev server starts. A database at the Alembic
+    head skips the schema checks entirely.
+    """
+    if schema_at_head():
+        app.logger.info('Schema at migration head; skipped schema checks')
+    else:
+        ensure_schema()
+        app.logger.info('Schema checked')
+    if not db.session.query(post_tag).first():
+        backfill_post_tags()
+    if not Conversation.query.first() and Message.query.first():
+        rebuild_conversations()
+    if not TimelineEntry.query.first():
+        rebuild_timelines()
+
+def preload_optional_modules():
+    # imported lazily for a fast cold start; gunicorn's master loads them before
+    # forking so every worker shares one copy
+    for name, available in (('markdown', MARKDOWN_AVAILABLE), ('pygments', CODEHILITE_AVAILABLE),
+                            ('PIL.Image', PIL_AVAILABLE)):
+        if available:
+            importlib.import_module(name)
+
+
+@app.cli.command('prepare-db')
+def prepare_db_command():
+    """Run the startup schema checks and backfills without serving."""
+    prepare_database()
+    print("✓ Database ready")
+
+
+STARTUP_PROBE = """
+import json, time
+from sqlalchemy.orm import configure_mappers
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+configure_mappers()  # paid by the first query either way; timed on its own
+t2 = time.perf_counter()
+with main.app.app_context():
+    at_head = main.schema_at_head()
+    main.prepare_database()
+print('BENCH ' + json.dumps([t1 - t0, t2 - t1, time.perf_counter() - t2, at_head]))
+"""
+
+
+@app.cli.command('bench-startup')
+@click.option('--rounds', default=5, show_default=True)
+def bench_startup_command(rounds):
+    """Time cold starts (import, mapper setup, prepare_database) in fresh interpreters."""
+    samples = []
+    for _ in range(rounds):
+        out = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=basedir,
+                             capture_output=True, text=True, check=True).stdout
+        *timings, at_head = json.loads(out.rsplit('BENCH ', 1)[1])
+        samples.append([t * 1000 for t in timings])
+    import_ms, mappers_ms, prepare_ms = (sorted(col)[rounds // 2] for col in zip(*samples))
+    print(f"✓ {rounds} cold starts ({'at migration head' if at_head else 'schema checks'}), median: "
+          f"import {import_ms:.0f} ms, mappers {mappers_ms:.0f} ms, prepare {prepare_ms:.0f} ms")
+
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
-        # Ensure missing columns exist to avoid runtime query errors
-        ensure_publish_at_column()
-        ensure_avatar_column()
-        ensure_bio_column()
-        ensure_follow_status_column()
-        
-        # Fix existing posts with NULL published_at and draft=False
-        # These should have been published
-        try:
-            from sqlalchemy import text
-            db.session.execute(text("""
-                UPDATE post 
-                SET published_at = created_at 
-                WHERE published_at IS NULL AND draft = 0 AND created_at IS NOT NULL
-            """))
-            db.session.commit()
-            print("✓ Fixed existing posts with NULL published_at")
-        except Exception as e:
-            print(f"Note: Could not auto-fix posts: {e}")
+        prepare_database()
+    # Under the debug reloader only the serving child runs the jobs
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs()
     # Add host='0.0.0.0' here
     app.run(debug=True, port=5001, host='0.0.0.0')
-    
\ No newline at end of file
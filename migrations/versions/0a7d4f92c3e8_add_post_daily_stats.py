@@ -0,0 +1,37 @@
+"""add post daily stats
+
+Revision ID: 0a7d4f92c3e8
+Revises: f83b2e6a4c19
+Create Date: 2026-10-18 21:24:40.772918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a7d4f92c3e8'
+down_revision = 'f83b2e6a4c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_daily_stats',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('likes', sa.Integer(), nullable=False),
+    sa.Column('comments', sa.Integer(), nullable=False),
+    sa.Column('views', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.PrimaryKeyConstraint('post_id', 'day')
+    )
+    with op.batch_alter_table('post_daily_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_post_daily_stats_day', ['day'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('post_daily_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_daily_stats_day')
+
+    op.drop_table('post_daily_stats')
@@ -0,0 +1,31 @@
+"""add post html cache
+
+Revision ID: 1c6e8b35d0f4
+Revises: 0a7d4f92c3e8
+Create Date: 2026-10-18 22:02:31.418870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c6e8b35d0f4'
+down_revision = '0a7d4f92c3e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rows are rendered lazily on first read or with `flask render-markdown`
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('render_version', sa.String(length=50), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('render_version')
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('content_html')
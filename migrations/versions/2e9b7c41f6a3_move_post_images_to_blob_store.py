@@ -0,0 +1,83 @@
+"""move post images to blob store
+
+Revision ID: 2e9b7c41f6a3
+Revises: 1c6e8b35d0f4
+Create Date: 2026-10-18 22:41:07.265314
+
+"""
+import base64
+import hashlib
+import os
+import secrets
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = '2e9b7c41f6a3'
+down_revision = '1c6e8b35d0f4'
+branch_labels = None
+depends_on = None
+
+
+def _sniff(data):
+    # mirrors main.sniff_image_ext; migrations stay independent of the app module
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    if data.startswith(b'BM'):
+        return 'bmp'
+    return 'bin'
+
+
+def _store(folder, data):
+    name = f"{hashlib.sha256(data).hexdigest()}.{_sniff(data)}"
+    path = os.path.join(folder, name[:2], name[2:4], name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{secrets.token_hex(4)}.tmp"
+        with open(tmp, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    return name
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_blob', sa.String(length=80), nullable=True))
+
+    # extract inline base64 images into <app root>/blobs and keep only the reference
+    folder = os.path.join(current_app.root_path, 'blobs')
+    conn = op.get_bind()
+    rows = conn.execute(sa.text('SELECT id, image_data FROM post WHERE image_data IS NOT NULL')).all()
+    for post_id, data in rows:
+        try:
+            raw = base64.b64decode(data)
+        except (ValueError, TypeError):
+            raw = b''
+        conn.execute(sa.text('UPDATE post SET image_blob = :blob, image_data = NULL WHERE id = :id'),
+                     {'blob': _store(folder, raw) if raw else None, 'id': post_id})
+
+
+def downgrade():
+    # inline the blobs again so the old data: URI templates keep working
+    folder = os.path.join(current_app.root_path, 'blobs')
+    conn = op.get_bind()
+    rows = conn.execute(sa.text('SELECT id, image_blob FROM post WHERE image_blob IS NOT NULL')).all()
+    for post_id, name in rows:
+        path = os.path.join(folder, name[:2], name[2:4], name)
+        if os.path.exists(path):
+            with open(path, 'rb') as fh:
+                data = base64.b64encode(fh.read()).decode('utf-8')
+            conn.execute(sa.text('UPDATE post SET image_data = :data WHERE id = :id'),
+                         {'data': data, 'id': post_id})
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('image_blob')
@@ -0,0 +1,31 @@
+"""add image variant maps
+
+Revision ID: 3f5a8d27c9e1
+Revises: 2e9b7c41f6a3
+Create Date: 2026-10-18 23:05:52.730146
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f5a8d27c9e1'
+down_revision = '2e9b7c41f6a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled by the image worker pool; run `flask build-image-variants` for existing uploads
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_variants', sa.Text(), nullable=True))
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avatar_variants', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('avatar_variants')
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('image_variants')
@@ -0,0 +1,27 @@
+"""add user avatar blob
+
+Revision ID: 4b1d6e93a7f2
+Revises: 3f5a8d27c9e1
+Create Date: 2026-10-18 23:31:14.902583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1d6e93a7f2'
+down_revision = '3f5a8d27c9e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # new avatars go to the blob store; avatar_filename stays for existing uploads
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avatar_blob', sa.String(length=80), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('avatar_blob')
@@ -0,0 +1,30 @@
+"""backfill post published_at
+
+Revision ID: 5d8c2f61b4a9
+Revises: 4b1d6e93a7f2
+Create Date: 2026-10-18 23:58:40.117092
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8c2f61b4a9'
+down_revision = '4b1d6e93a7f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # published posts saved before published_at was always set; this used to run
+    # as an UPDATE over the whole table on every startup
+    op.execute("""
+        UPDATE post
+        SET published_at = created_at
+        WHERE published_at IS NULL AND draft = 0 AND created_at IS NOT NULL
+    """)
+
+
+def downgrade():
+    # data fix only; the original NULLs are not recoverable
+    pass
@@ -0,0 +1,28 @@
+"""add notification started_at
+
+Revision ID: 6e3a9b15d7c4
+Revises: 5d8c2f61b4a9
+Create Date: 2026-10-18 06:24:13.502816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e3a9b15d7c4'
+down_revision = '5d8c2f61b4a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('started_at', sa.DateTime(), nullable=True))
+    # existing groups never recorded their first event; the latest is the closest bound
+    op.execute('UPDATE notification SET started_at = created_at')
+
+
+def downgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_column('started_at')
@@ -0,0 +1,54 @@
+"""add timeline entry
+
+Revision ID: 8e4a0d7c51b2
+Revises: 3b1f6c2d9a47
+Create Date: 2026-10-18 11:03:27.540917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4a0d7c51b2'
+down_revision = '3b1f6c2d9a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('timeline_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'post_id', name='unique_timeline_entry')
+    )
+    with op.batch_alter_table('timeline_entry', schema=None) as batch_op:
+        batch_op.create_index('ix_timeline_user_created', ['user_id', 'created_at', 'post_id'], unique=False)
+        batch_op.create_index('ix_timeline_user_author', ['user_id', 'author_id'], unique=False)
+
+    # Seed timelines from accepted follows (most recent 200 posts per followed author)
+    op.execute("""
+        INSERT OR IGNORE INTO timeline_entry (user_id, post_id, author_id, created_at)
+        SELECT f.follower_id, p.id, p.user_id, p.created_at
+        FROM follow f JOIN post p ON p.user_id = f.following_id
+        WHERE f.status = 'accepted' AND p.draft = 0 AND p.created_at IS NOT NULL
+          AND p.id IN (
+              SELECT p2.id FROM post p2 WHERE p2.user_id = f.following_id
+              ORDER BY p2.created_at DESC LIMIT 200
+          )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('timeline_entry', schema=None) as batch_op:
+        batch_op.drop_index('ix_timeline_user_author')
+        batch_op.drop_index('ix_timeline_user_created')
+
+    op.drop_table('timeline_entry')
@@ -0,0 +1,35 @@
+"""add trending score
+
+Revision ID: a93e5f1c7b20
+Revises: f4c07b3e6d95
+Create Date: 2026-10-18 18:41:09.337156
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93e5f1c7b20'
+down_revision = 'f4c07b3e6d95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trending_score',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.PrimaryKeyConstraint('post_id')
+    )
+    with op.batch_alter_table('trending_score', schema=None) as batch_op:
+        batch_op.create_index('ix_trending_score_score_post', ['score', 'post_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('trending_score', schema=None) as batch_op:
+        batch_op.drop_index('ix_trending_score_score_post')
+
+    op.drop_table('trending_score')
@@ -0,0 +1,55 @@
+"""add conversation
+
+Revision ID: b6d3f20a8e17
+Revises: a93e5f1c7b20
+Create Date: 2026-10-18 19:12:44.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d3f20a8e17'
+down_revision = 'a93e5f1c7b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_a_id', sa.Integer(), nullable=False),
+    sa.Column('user_b_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_message_at', sa.DateTime(), nullable=True),
+    sa.Column('unread_a', sa.Integer(), nullable=False),
+    sa.Column('unread_b', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['last_message_id'], ['message.id'], ),
+    sa.ForeignKeyConstraint(['user_a_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['user_b_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_a_id', 'user_b_id', name='unique_conversation')
+    )
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.create_index('ix_conversation_a_last', ['user_a_id', 'last_message_at'], unique=False)
+        batch_op.create_index('ix_conversation_b_last', ['user_b_id', 'last_message_at'], unique=False)
+
+    # Seed one summary row per user pair from existing messages
+    op.execute("""
+        INSERT INTO conversation (user_a_id, user_b_id, last_message_id, last_message_at, unread_a, unread_b)
+        SELECT MIN(sender_id, recipient_id) AS a, MAX(sender_id, recipient_id) AS b,
+               MAX(id), MAX(created_at),
+               SUM(CASE WHEN recipient_id = MIN(sender_id, recipient_id) AND is_read = 0 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN recipient_id = MAX(sender_id, recipient_id) AND sender_id != recipient_id AND is_read = 0 THEN 1 ELSE 0 END)
+        FROM message
+        GROUP BY a, b
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversation_b_last')
+        batch_op.drop_index('ix_conversation_a_last')
+
+    op.drop_table('conversation')
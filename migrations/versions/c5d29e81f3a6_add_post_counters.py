@@ -0,0 +1,37 @@
+"""add post counters
+
+Revision ID: c5d29e81f3a6
+Revises: 8e4a0d7c51b2
+Create Date: 2026-10-18 13:26:05.872413
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d29e81f3a6'
+down_revision = '8e4a0d7c51b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('view_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute("""
+        UPDATE post SET
+            like_count = (SELECT COUNT(*) FROM "like" WHERE "like".post_id = post.id),
+            comment_count = (SELECT COUNT(*) FROM comment WHERE comment.post_id = post.id),
+            view_count = (SELECT COUNT(*) FROM post_view WHERE post_view.post_id = post.id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('view_count')
+        batch_op.drop_column('comment_count')
+        batch_op.drop_column('like_count')
@@ -0,0 +1,26 @@
+"""add message pair index
+
+Revision ID: c84e1a7d2f59
+Revises: b6d3f20a8e17
+Create Date: 2026-10-18 19:40:21.604377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c84e1a7d2f59'
+down_revision = 'b6d3f20a8e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_pair_created', ['sender_id', 'recipient_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_pair_created')
@@ -0,0 +1,34 @@
+"""add user unread counters
+
+Revision ID: d29f7b4c1e83
+Revises: c84e1a7d2f59
+Create Date: 2026-10-18 20:05:37.219846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd29f7b4c1e83'
+down_revision = 'c84e1a7d2f59'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_notifications', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('unread_messages', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute("""
+        UPDATE user SET
+            unread_notifications = (SELECT COUNT(*) FROM notification WHERE notification.user_id = user.id AND notification.is_read = 0),
+            unread_messages = (SELECT COUNT(*) FROM message WHERE message.recipient_id = user.id AND message.is_read = 0)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('unread_messages')
+        batch_op.drop_column('unread_notifications')
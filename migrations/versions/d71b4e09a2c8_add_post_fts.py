@@ -0,0 +1,44 @@
+"""add post full-text index
+
+Revision ID: d71b4e09a2c8
+Revises: c5d29e81f3a6
+Create Date: 2026-10-18 14:48:51.209377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd71b4e09a2c8'
+down_revision = 'c5d29e81f3a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE VIRTUAL TABLE post_fts USING fts5(title, content, content='post', content_rowid='id', tokenize='unicode61')")
+    op.execute("""
+        CREATE TRIGGER post_fts_ai AFTER INSERT ON post BEGIN
+            INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER post_fts_ad AFTER DELETE ON post BEGIN
+            INSERT INTO post_fts(post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER post_fts_au AFTER UPDATE OF title, content ON post BEGIN
+            INSERT INTO post_fts(post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+    """)
+    op.execute("INSERT INTO post_fts(post_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS post_fts_au')
+    op.execute('DROP TRIGGER IF EXISTS post_fts_ad')
+    op.execute('DROP TRIGGER IF EXISTS post_fts_ai')
+    op.execute('DROP TABLE IF EXISTS post_fts')
@@ -0,0 +1,59 @@
+"""add normalized tag tables
+
+Revision ID: e2a86f5c0d14
+Revises: d71b4e09a2c8
+Create Date: 2026-10-18 16:02:13.664920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a86f5c0d14'
+down_revision = 'd71b4e09a2c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tag',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('post_tag',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ),
+    sa.PrimaryKeyConstraint('post_id', 'tag_id')
+    )
+    with op.batch_alter_table('post_tag', schema=None) as batch_op:
+        batch_op.create_index('ix_post_tag_tag_post', ['tag_id', 'post_id'], unique=False)
+
+    # Backfill from the comma-separated post.tags strings
+    conn = op.get_bind()
+    tag_ids = {}
+    rows = conn.execute(sa.text("SELECT id, tags FROM post WHERE tags IS NOT NULL AND tags != ''")).fetchall()
+    for post_id, tags in rows:
+        for name in dict.fromkeys(part.strip().lower()[:50] for part in tags.split(',')):
+            if not name:
+                continue
+            if name not in tag_ids:
+                tag_ids[name] = conn.execute(
+                    sa.text('INSERT INTO tag (name) VALUES (:name)'), {'name': name}
+                ).lastrowid
+            conn.execute(
+                sa.text('INSERT OR IGNORE INTO post_tag (post_id, tag_id) VALUES (:post_id, :tag_id)'),
+                {'post_id': post_id, 'tag_id': tag_ids[name]}
+            )
+
+
+def downgrade():
+    with op.batch_alter_table('post_tag', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_tag_tag_post')
+
+    op.drop_table('post_tag')
+    op.drop_table('tag')
@@ -0,0 +1,32 @@
+"""add notification grouping
+
+Revision ID: e51a9c3d7b06
+Revises: d29f7b4c1e83
+Create Date: 2026-10-18 20:31:52.840117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e51a9c3d7b06'
+down_revision = 'd29f7b4c1e83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('actor_count', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('recent_actor_ids', sa.String(length=100), nullable=True))
+        batch_op.create_index('ix_notification_group', ['user_id', 'type', 'post_id', 'is_read'], unique=False)
+        batch_op.create_index('ix_notification_user_created', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_index('ix_notification_user_created')
+        batch_op.drop_index('ix_notification_group')
+        batch_op.drop_column('recent_actor_ids')
+        batch_op.drop_column('actor_count')
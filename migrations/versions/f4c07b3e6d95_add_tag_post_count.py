@@ -0,0 +1,35 @@
+"""add tag post count
+
+Revision ID: f4c07b3e6d95
+Revises: e2a86f5c0d14
+Create Date: 2026-10-18 17:20:38.051742
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c07b3e6d95'
+down_revision = 'e2a86f5c0d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tag', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_tag_post_count', ['post_count'], unique=False)
+
+    op.execute("""
+        UPDATE tag SET post_count = (
+            SELECT COUNT(*) FROM post_tag JOIN post ON post.id = post_tag.post_id
+            WHERE post_tag.tag_id = tag.id AND post.draft = 0
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('tag', schema=None) as batch_op:
+        batch_op.drop_index('ix_tag_post_count')
+        batch_op.drop_column('post_count')
@@ -0,0 +1,38 @@
+"""add view sketches
+
+Revision ID: f83b2e6a4c19
+Revises: e51a9c3d7b06
+Create Date: 2026-10-18 20:58:14.093561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f83b2e6a4c19'
+down_revision = 'e51a9c3d7b06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_view_sketch',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('registers', sa.LargeBinary(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.PrimaryKeyConstraint('post_id')
+    )
+    op.create_table('post_view_day_sketch',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('registers', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.PrimaryKeyConstraint('post_id', 'day')
+    )
+
+
+def downgrade():
+    op.drop_table('post_view_day_sketch')
+    op.drop_table('post_view_sketch')
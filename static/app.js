@@ -27,14 +27,6 @@ document.addEventListener('DOMContentLoaded', function () {
     const passwordHint = document.getElementById('passwordHint');
     const registerForm = document.getElementById('registerForm');
 
-    // Reset all like buttons to 0 on page load
-    const likeButtons = document.querySelectorAll('.btn-like');
-    likeButtons.forEach(btn => {
-        btn.classList.remove('liked');
-        btn.querySelector('span:nth-child(2)').textContent = 'Like';
-        btn.querySelector('span:last-child').textContent = '(0)';
-    });
-
     if (regUsername) {
         let timeout;
         regUsername.addEventListener('input', function () {
@@ -191,23 +183,39 @@ function toggleLike(button, postId) {
         .catch(err => console.error('Like error:', err));
 }
 
-// Load like state on page load
+// Load like/bookmark state on page load (one request for every post on the page)
 document.addEventListener('DOMContentLoaded', function () {
-    const likeButtons = document.querySelectorAll('[data-post-id]');
-    likeButtons.forEach(button => {
-        const postId = button.getAttribute('data-post-id');
-        fetch(`/api/is_liked/${postId}`)
-            .then(res => res.json())
-            .then(data => {
-                if (data.liked) {
+    const likeButtons = document.querySelectorAll('.btn-like[data-post-id]');
+    const bookmarkButtons = document.querySelectorAll('[data-bookmark-id]');
+    const ids = new Set();
+    likeButtons.forEach(button => ids.add(button.getAttribute('data-post-id')));
+    bookmarkButtons.forEach(button => ids.add(button.getAttribute('data-bookmark-id')));
+    if (ids.size === 0) return;
+
+    fetch(`/api/post_state?ids=${Array.from(ids).join(',')}`)
+        .then(res => res.json())
+        .then(data => {
+            const posts = data.posts || {};
+            likeButtons.forEach(button => {
+                const state = posts[button.getAttribute('data-post-id')];
+                if (!state) return;
+                if (state.liked) {
                     button.classList.add('liked');
                     button.querySelector('span:nth-child(2)').textContent = 'Liked';
                 }
                 const countSpan = button.querySelector('.like-count');
-                countSpan.textContent = `(${data.like_count})`;
-            })
-            .catch(err => console.error('Error loading like state:', err));
-    });
+                if (countSpan) countSpan.textContent = `(${state.like_count})`;
+            });
+            bookmarkButtons.forEach(button => {
+                const state = posts[button.getAttribute('data-bookmark-id')];
+                if (state && state.bookmarked) {
+                    button.classList.add('bookmarked');
+                    button.style.background = 'rgba(255,107,53,0.15)';
+                    button.style.borderColor = 'rgba(255,107,53,0.3)';
+                }
+            });
+        })
+        .catch(err => console.error('Error loading post state:', err));
 });
 
 // Copy Post Link to Clipboard
@@ -228,6 +236,56 @@ function scrollToComments(postId) {
     }
 }
 
+// Expand a feed card's comment preview to the full thread
+function loadAllComments(button, postId) {
+    const list = button.parentElement.querySelector('.comment-list');
+    if (!list) return;
+    button.disabled = true;
+
+    fetch(`/api/comments/${postId}`)
+        .then(res => res.json())
+        .then(data => {
+            if (!data.success) return;
+            list.innerHTML = '';
+            data.comments.forEach(c => {
+                const item = document.createElement('div');
+                item.className = 'comment-item';
+                item.innerHTML = `
+                    <div style="display:flex;gap:10px">
+                        <div class="comment-author-badge">
+                            <img style="width:32px;height:32px;border-radius:6px;object-fit:cover" alt="avatar">
+                            ${c.is_op ? '<span class="author-badge">OP</span>' : ''}
+                        </div>
+                        <div style="flex:1">
+                            <div style="display:flex;gap:8px;align-items:center">
+                                <span class="comment-author" style="font-weight:600;font-size:13px;color:var(--text)"></span>
+                                <span class="comment-date" style="font-size:12px;color:var(--muted)"></span>
+                            </div>
+                            <div class="comment-body" style="color:var(--text);font-size:13px;margin-top:4px;line-height:1.5"></div>
+                        </div>
+                    </div>`;
+                item.querySelector('img').src = c.avatar_url;
+                item.querySelector('.comment-author').textContent = c.author;
+                item.querySelector('.comment-date').textContent = c.created_at;
+                item.querySelector('.comment-body').textContent = c.body;
+                if (c.delete_url) {
+                    const form = document.createElement('form');
+                    form.method = 'post';
+                    form.action = c.delete_url;
+                    form.style.margin = '0';
+                    form.innerHTML = '<button type="submit" class="post-action-btn delete" style="padding:6px 10px"><i class="fas fa-trash"></i></button>';
+                    item.firstElementChild.appendChild(form);
+                }
+                list.appendChild(item);
+            });
+            button.remove();
+        })
+        .catch(err => {
+            console.error('Error loading comments:', err);
+            button.disabled = false;
+        });
+}
+
 // Toggle Follow Button
 function toggleFollow(userId, button) {
     const isFollowing = button.classList.contains('following');
@@ -671,4 +729,50 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 });
 
+// Live updates pushed by the server (Server-Sent Events).
+// Re-broadcast as `live:<event>` DOM events so individual pages can react.
+document.addEventListener('DOMContentLoaded', function () {
+    const url = document.body.dataset.liveEvents;
+    if (!url || !window.EventSource) return;
+
+    // Streams are closed by the server after a few minutes and reopened by the
+    // browser; resync the badges in case an event landed while we were reconnecting.
+    let opened = false;
+    function connect() {
+        const source = new EventSource(url);
+        source.addEventListener('open', function () {
+            if (opened) {
+                fetch('/api/unread_count').then(r => r.json()).then(data => {
+                    setNavBadge('notificationBadge', data.count);
+                    setNavBadge('messageBadge', data.messages);
+                }).catch(() => {});
+            }
+            opened = true;
+        });
+        // A refused stream (503: too many open) closes for good; try again after a pause
+        source.addEventListener('error', function () {
+            if (source.readyState === EventSource.CLOSED) {
+                opened = true;  // the badges may be stale by the time a stream opens
+                setTimeout(connect, 30000 + Math.random() * 30000);
+            }
+        });
+        ['message', 'notification', 'follow_request'].forEach(name => {
+            source.addEventListener(name, function (e) {
+                document.dispatchEvent(new CustomEvent(`live:${name}`, { detail: JSON.parse(e.data) }));
+            });
+        });
+    }
+    connect();
+});
+
+function setNavBadge(id, count) {
+    const badge = document.getElementById(id);
+    if (!badge) return;
+    badge.textContent = count > 99 ? '99+' : count;
+    badge.hidden = !count;
+}
+
+document.addEventListener('live:notification', e => setNavBadge('notificationBadge', e.detail.unread));
+document.addEventListener('live:message', e => setNavBadge('messageBadge', e.detail.unread));
+
 console.log('✨ Enhanced animations loaded successfully!');
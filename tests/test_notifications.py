@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from main import app, db, User, Post, Like, Notification, write_notification_batch
+
+
+class NotificationBatchTest(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.author, self.a, self.b, self.c = users = [
+            User(username=name, password='x') for name in ('author', 'a', 'b', 'c')
+        ]
+        db.session.add_all(users)
+        db.session.flush()
+        self.post = Post(title='Post', content='Body', user_id=self.author.id)
+        db.session.add(self.post)
+        db.session.commit()
+        self.clock = datetime.utcnow()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def event(self, actor, **fields):
+        self.clock += timedelta(seconds=1)
+        return dict(user_id=self.author.id, actor_id=actor.id, type='like', post_id=self.post.id,
+                    created_at=self.clock, **fields)
+
+    def like(self, actor):
+        db.session.add(Like(post_id=self.post.id, user_id=actor.id, created_at=self.clock + timedelta(seconds=1)))
+        db.session.commit()
+        return self.event(actor)
+
+    def unlike(self, actor):
+        Like.query.filter_by(post_id=self.post.id, user_id=actor.id).delete()
+        db.session.commit()
+        return self.event(actor, retract=True)
+
+    def notification(self):
+        return Notification.query.filter_by(user_id=self.author.id, type='like', post_id=self.post.id).one_or_none()
+
+    def test_relike_across_flushes_counts_once(self):
+        write_notification_batch([self.like(self.a), self.like(self.b), self.like(self.c)])
+        self.assertEqual(self.notification().actor_count, 3)
+
+        write_notification_batch([self.unlike(self.a)])
+        self.assertEqual(self.notification().actor_count, 2)
+
+        write_notification_batch([self.like(self.a)])
+        notif = self.notification()
+        self.assertEqual(notif.actor_count, 3)
+        self.assertEqual(notif.recent_actor_list, [self.a.id, self.c.id])
+        self.assertEqual(db.session.get(User, self.author.id).unread_notifications, 1)
+
+    def test_unlike_by_every_actor_removes_the_notification(self):
+        write_notification_batch([self.like(self.a)])
+        write_notification_batch([self.unlike(self.a)])
+        self.assertIsNone(self.notification())
+        self.assertEqual(db.session.get(User, self.author.id).unread_notifications, 0)
+
+    def test_likes_before_the_group_are_not_counted(self):
+        # a legacy database: likes from long ago that never produced a notification
+        for actor in (self.b, self.c):
+            db.session.add(Like(post_id=self.post.id, user_id=actor.id, created_at=self.clock - timedelta(days=30)))
+        db.session.commit()
+
+        write_notification_batch([self.like(self.a)])
+        notif = self.notification()
+        self.assertEqual(notif.actor_count, 1)
+        self.assertEqual(notif.recent_actor_list, [self.a.id])
+
+    def test_read_group_is_not_recounted(self):
+        write_notification_batch([self.like(self.a), self.like(self.b)])
+        self.notification().is_read = True
+        db.session.commit()
+
+        write_notification_batch([self.like(self.c)])
+        unread = Notification.query.filter_by(user_id=self.author.id, is_read=False).one()
+        self.assertEqual(unread.actor_count, 1)
+        self.assertEqual(unread.recent_actor_list, [self.c.id])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from werkzeug.security import generate_password_hash
+
+from main import app, db, User, Post, Comment, Bookmark, refresh_trending_scores, set_post_tags
+
+
+class FeedQueryCountTest(unittest.TestCase):
+    """Listing pages load authors, comments and tags in batches, so their query count
+    doesn't grow with the number of posts shown (X-Query-Count, sent when testing)."""
+
+    # No app context is held between requests: each request gets its own, and with
+    # it a fresh ``g`` for the counter
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        with app.app_context():
+            db.create_all()
+            viewer = User(username='viewer', password=generate_password_hash('12345678', method='pbkdf2:sha256:1'))
+            db.session.add(viewer)
+            db.session.commit()
+            self.viewer_id = viewer.id
+        self.client = app.test_client()
+        self.client.post('/login', data={'username': 'viewer', 'password': '12345678'})
+
+    def tearDown(self):
+        with app.app_context():
+            db.drop_all()
+
+    def add_posts(self, count):
+        with app.app_context():
+            start = Post.query.count()
+            for i in range(start, start + count):
+                author = User(username=f'author{i}', password='x')
+                commenter = User(username=f'commenter{i}', password='x')
+                db.session.add_all([author, commenter])
+                db.session.flush()
+                post = Post(title=f'hello {i}', content='Body', user_id=author.id, tags='python')
+                set_post_tags(post, 'python')
+                db.session.add(post)
+                db.session.flush()
+                db.session.add_all([
+                    Comment(post_id=post.id, user_id=commenter.id, body='First'),
+                    Comment(post_id=post.id, user_id=author.id, body='Reply'),
+                    Bookmark(post_id=post.id, user_id=self.viewer_id),
+                ])
+            db.session.commit()
+            refresh_trending_scores()
+
+    def render(self, url):
+        self.client.get(url)  # warm the per-process caches (avatars, unread badges)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def assertConstantQueries(self, url):
+        self.add_posts(1)
+        one = self.render(url)
+        self.add_posts(7)
+        eight = self.render(url)
+        self.assertIn(b'hello 7', eight.data, url)
+        self.assertEqual(eight.headers['X-Query-Count'], one.headers['X-Query-Count'], url)
+
+    def test_feed(self):
+        self.assertConstantQueries('/')
+
+    def test_search(self):
+        self.assertConstantQueries('/search?q=hello')
+
+    def test_tag(self):
+        self.assertConstantQueries('/tag/python')
+
+    def test_trending(self):
+        self.assertConstantQueries('/trending')
+
+    def test_bookmarks(self):
+        self.assertConstantQueries('/bookmarks')
+
+
+if __name__ == '__main__':
+    unittest.main()
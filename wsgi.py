@@ -0,0 +1,7 @@
+"""WSGI entry point for production: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Also the target of ``flask <command>`` (see .flaskenv). Importing this module only
+loads the app; schema checks run in the gunicorn master or through
+``flask prepare-db``.
+"""
+from main import app